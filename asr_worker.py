@@ -0,0 +1,598 @@
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import vosk
+
+# ASR WORKER
+#
+# Vosk decoding runs in a process of its own, so handlers, speech and
+# timers in the assistant cannot hold up recognition, and recognition gets
+# a core to itself. The capture callback writes blocks into a ring in
+# shared memory and pokes the worker through its stdin (NOTIFY_BLOCK per
+# block, NOTIFY_RESET to drop the utterance in progress); the worker runs
+# the VAD and the recognizers and answers with one JSON event per line:
+#
+#     ["ready"]               model loaded
+#     ["onset"]               speech started
+#     ["wake"]                wake word heard, command window open
+#     ["partial", text]       a partial result that has stopped changing
+#     ["final", text]         a complete transcript
+#     ["timeout"]             wake word but no command in time
+#     ["speech_end"]          the VAD closed the utterance
+#     ["utterance_end"]       after that utterance's final result, if any
+
+# Audio capture: the recognizer is fed at the model's native rate. Mics that
+# cannot open at SAMPLE_RATE are captured at their default rate and decimated.
+SAMPLE_RATE = 16000
+BLOCK_SIZE = 1600             # samples per block at SAMPLE_RATE (100 ms)
+
+# Voice activity detection: silent blocks never reach the recognizers
+VAD_ENERGY_THRESHOLD = 300    # minimum RMS (int16) counted as speech
+VAD_NOISE_RATIO = 3.0         # speech must be this much louder than the noise floor
+VAD_MAX_ZCR = 0.35            # higher zero-crossing rates are treated as hiss
+VAD_PREROLL_BLOCKS = 3        # blocks kept before onset so words aren't clipped
+VAD_HANGOVER_BLOCKS = 8       # silent blocks before an utterance is closed
+VAD_FLOOR_RISE = 0.002        # noise floor drift towards the level during speech
+VAD_MAX_SPEECH_BLOCKS = 300   # 30 s: steady noise (a TV, a fan) is not speech
+
+# Fixed-size capture buffer between the audio callback and the worker.
+# When recognition falls behind the oldest audio is dropped.
+AUDIO_BUFFER_BLOCKS = 50      # 5 s of audio at BLOCK_SIZE
+CLOSE_TIMEOUT = 2             # seconds the worker gets to exit on its own
+NOTIFY_BLOCK = b"\0"
+NOTIFY_RESET = b"r"
+SLOT_BYTES = (BLOCK_SIZE + 16) * 2
+WAKE_WORDS = ["veer", "वीर"]
+
+# Wake word gate: a grammar-restricted recognizer listens for "वीर" and only
+# then is audio handed to the full recognizer.
+WAKE_GRAMMAR = json.dumps(WAKE_WORDS + ["[unk]"], ensure_ascii=False)
+WAKE_PREROLL_BLOCKS = 16      # blocks replayed into the full recognizer (~1.5 s)
+COMMAND_WINDOW = 6            # seconds of audio to wait for a command after wake word
+
+# A partial is reported once it has not changed for this many blocks. One
+# repeat (100 ms) is too easily the gap between "टाइम" and "टाइमर"; 300 ms
+# of no change is a pause, and still well inside VAD_HANGOVER_BLOCKS.
+PARTIAL_STABLE_BLOCKS = 4
+
+# SHARED RING
+
+# Header fields, as uint64
+WRITE, READ, FLUSH, OVERFLOWS, HIGH_WATER, SLOTS, SLOT_SIZE = range(7)
+HEADER_BYTES = 64
+
+def attach_shared_memory(name):
+    """Opens an existing segment without letting this process's resource
+    tracker unlink it when the process exits."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+class SharedAudioRing:
+    """Ring of audio blocks in shared memory for one writer (the capture
+    callback) and one reader (the worker). Neither side locks: the writer
+    only moves WRITE and FLUSH, the reader only READ, and a block the
+    writer may have overwritten while it was being copied is dropped."""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.header = np.ndarray(HEADER_BYTES // 8, np.uint64, memory.buf)
+        self.slots = int(self.header[SLOTS])
+        self.slot_bytes = int(self.header[SLOT_SIZE])
+        self.lengths = np.ndarray(self.slots, np.uint32, memory.buf, HEADER_BYTES)
+        self.data = np.ndarray((self.slots, self.slot_bytes), np.uint8, memory.buf,
+                               HEADER_BYTES + 4 * self.slots)
+
+    @classmethod
+    def create(cls, slots=AUDIO_BUFFER_BLOCKS, slot_bytes=SLOT_BYTES):
+        memory = shared_memory.SharedMemory(
+            create=True, size=HEADER_BYTES + slots * (4 + slot_bytes))
+        header = np.ndarray(HEADER_BYTES // 8, np.uint64, memory.buf)
+        header[:] = 0
+        header[SLOTS] = slots
+        header[SLOT_SIZE] = slot_bytes
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(attach_shared_memory(name))
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def overflows(self):
+        return int(self.header[OVERFLOWS])
+
+    # WRITER
+
+    def write(self, data):
+        data = np.frombuffer(memoryview(data).cast("B"), np.uint8)
+        header = self.header
+
+        # Blocks larger than a slot are split over several slots
+        for start in range(0, len(data), self.slot_bytes):
+            chunk = data[start:start + self.slot_bytes]
+            seq = int(header[WRITE])
+            index = seq % self.slots
+
+            self.data[index, :len(chunk)] = chunk
+            self.lengths[index] = len(chunk)
+            header[WRITE] = seq + 1
+
+            waiting = seq + 1 - max(int(header[READ]), int(header[FLUSH]))
+            if waiting > int(header[HIGH_WATER]):
+                header[HIGH_WATER] = min(waiting, self.slots)
+
+    def flush(self):
+        """Drops everything written so far."""
+        self.header[FLUSH] = self.header[WRITE]
+
+    # READER
+
+    def read(self):
+        """Next block, or None when the reader has caught up."""
+        header = self.header
+
+        while True:
+            written = int(header[WRITE])
+            seq = max(int(header[READ]), int(header[FLUSH]))
+
+            if seq >= written:
+                header[READ] = seq
+                return None
+
+            # Lapped: the oldest blocks are gone or about to be
+            if written - seq >= self.slots:
+                dropped = written - seq - self.slots + 1
+                header[OVERFLOWS] = int(header[OVERFLOWS]) + dropped
+                seq += dropped
+
+            index = seq % self.slots
+            data = self.data[index, :self.lengths[index]].tobytes()
+
+            if int(header[WRITE]) - seq >= self.slots:
+                # Overwritten while being copied
+                header[OVERFLOWS] = int(header[OVERFLOWS]) + 1
+                header[READ] = seq + 1
+                continue
+
+            header[READ] = seq + 1
+            return data
+
+    def skip_to_end(self):
+        self.header[READ] = self.header[WRITE]
+
+    def stats(self):
+        header = self.header
+        return (f"Audio buffer wrote {int(header[WRITE])} blocks, "
+                f"{int(header[OVERFLOWS])} overflows, "
+                f"high water {int(header[HIGH_WATER])}/{self.slots}")
+
+    def close(self, unlink=False):
+        self.header = self.lengths = self.data = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+# RECOGNITION
+
+class VoiceActivityDetector:
+    """Energy / zero-crossing VAD that drops silent blocks before recognition."""
+
+    def __init__(self):
+        self.preroll = collections.deque(maxlen=VAD_PREROLL_BLOCKS)
+        self.noise_floor = VAD_ENERGY_THRESHOLD / VAD_NOISE_RATIO
+        self.in_speech = False
+        self.hangover = 0
+        self.rms = 0.0
+        self.speech_blocks = 0
+        self.speech_energy = 0.0        # sum of block RMS in this utterance
+        self.frames_kept = 0
+        self.frames_dropped = 0
+
+    def is_speech(self, data):
+        x = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if not len(x):
+            return False
+
+        rms = float(np.sqrt(np.mean(x * x)))
+        zcr = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1])) / len(x)
+
+        threshold = max(VAD_ENERGY_THRESHOLD, self.noise_floor * VAD_NOISE_RATIO)
+        speech = rms > threshold and zcr < VAD_MAX_ZCR
+
+        # Track the background level while it is quiet, and creep up
+        # towards it during speech so noise that starts loud and stays
+        # (a TV switched on) is learned eventually
+        if not speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        else:
+            self.noise_floor += VAD_FLOOR_RISE * (rms - self.noise_floor)
+
+        self.rms = rms
+        return speech
+
+    def process(self, data):
+        """Returns (blocks to recognize, whether an utterance just ended)."""
+        frames = len(data) // 2
+
+        if self.is_speech(data):
+            self.hangover = VAD_HANGOVER_BLOCKS
+
+            if self.in_speech:
+                self.speech_blocks += 1
+                self.speech_energy += self.rms
+                if self.speech_blocks >= VAD_MAX_SPEECH_BLOCKS:
+                    # Far longer than any command: take its level as the
+                    # background and close the utterance
+                    self.noise_floor = self.speech_energy / self.speech_blocks
+                    self.in_speech = False
+                    self.frames_dropped += frames
+                    return [], True
+                blocks = [data]
+            else:
+                self.in_speech = True
+                self.speech_blocks = 1
+                self.speech_energy = self.rms
+                blocks = list(self.preroll) + [data]
+                self.preroll.clear()
+
+            self.frames_kept += sum(len(b) // 2 for b in blocks)
+            return blocks, False
+
+        if self.in_speech:
+            if self.hangover > 0:
+                self.hangover -= 1
+                self.frames_kept += frames
+                return [data], False
+
+            self.in_speech = False
+            self.frames_dropped += frames
+            return [], True
+
+        if len(self.preroll) == self.preroll.maxlen:
+            self.frames_dropped += len(self.preroll[0]) // 2
+        self.preroll.append(data)
+
+        return [], False
+
+    def reset(self):
+        """Forgets the utterance in progress; the noise floor and the
+        stats are kept."""
+        self.preroll.clear()
+        self.in_speech = False
+        self.hangover = 0
+        self.speech_blocks = 0
+        self.speech_energy = 0.0
+
+    def stats(self):
+        total = self.frames_kept + self.frames_dropped
+        dropped = 100 * self.frames_dropped / total if total else 0
+        return f"VAD kept {self.frames_kept} frames, dropped {self.frames_dropped} ({dropped:.1f}%)"
+
+def contains_wake_word(text):
+    return any(w in text.split() for w in WAKE_WORDS)
+
+class Recognizer:
+    """VAD, wake word gate and full recognizer. Turns audio blocks into
+    events; runs in the worker, or in-process for the replay harness."""
+
+    def __init__(self, model, partials=True):
+        self.rec = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+        self.wake_rec = vosk.KaldiRecognizer(model, SAMPLE_RATE, WAKE_GRAMMAR)
+        self.partials = partials
+        self.vad = VoiceActivityDetector()
+        self.wake_buffer = collections.deque(maxlen=WAKE_PREROLL_BLOCKS)
+        self.awake = False
+        # Counted in audio samples, not wall time, so a replayed recording
+        # times out exactly where it would have live
+        self.samples_heard = 0
+        self.awake_until = 0
+        self.last_partial = ""
+        self.partial_repeats = 0
+
+    def process(self, data):
+        events = []
+        self.samples_heard += len(data) // 2
+
+        was_in_speech = self.vad.in_speech
+        voiced, utterance_ended = self.vad.process(data)
+
+        if voiced and not was_in_speech:
+            events.append(["onset"])
+
+        for block in voiced:
+            events.extend(self.recognize(block))
+
+        if utterance_ended:
+            events.append(["speech_end"])
+            text = self.end_utterance()
+            if text:
+                events.append(["final", text])
+            events.append(["utterance_end"])
+
+        return events
+
+    def detect_wake_word(self, data):
+        self.wake_buffer.append(data)
+
+        if self.wake_rec.AcceptWaveform(data):
+            text = json.loads(self.wake_rec.Result()).get("text", "")
+        else:
+            text = json.loads(self.wake_rec.PartialResult()).get("partial", "")
+
+        if not contains_wake_word(text):
+            return False
+
+        self.wake_rec.Reset()
+        return True
+
+    def check_partial_result(self):
+        partial = json.loads(self.rec.PartialResult()).get("partial", "").strip().lower()
+
+        if partial != self.last_partial:
+            self.last_partial = partial
+            self.partial_repeats = 1
+            return []
+
+        self.partial_repeats += 1
+
+        # Once per partial; whether it is a command is the assistant's call
+        if self.partial_repeats != PARTIAL_STABLE_BLOCKS or not partial:
+            return []
+
+        return [["partial", partial]]
+
+    def recognize(self, data):
+        events = []
+
+        # Cheap wake word stage, the full recognizer stays idle
+        if not self.awake:
+            if not self.detect_wake_word(data):
+                return events
+
+            events.append(["wake"])
+            self.awake = True
+            self.awake_until = self.samples_heard + COMMAND_WINDOW * SAMPLE_RATE
+            self.last_partial = ""
+
+            # Replay the buffered audio so the command is not clipped
+            self.rec.Reset()
+            blocks = list(self.wake_buffer)
+            self.wake_buffer.clear()
+        else:
+            blocks = [data]
+
+        for block in blocks:
+            if self.rec.AcceptWaveform(block):
+                result = json.loads(self.rec.Result())
+                text = result.get("text", "").strip().lower()
+                if text:
+                    self.awake = False
+                    events.append(["final", text])
+                    return events
+
+        if self.samples_heard > self.awake_until:
+            self.rec.Reset()
+            self.awake = False
+            events.append(["timeout"])
+            return events
+
+        if self.partials:
+            events.extend(self.check_partial_result())
+
+        return events
+
+    def end_utterance(self):
+        # Silence after speech: nothing more will arrive for this utterance,
+        # so don't wait for Vosk's own endpointing
+        self.wake_rec.Reset()
+        self.wake_buffer.clear()
+
+        if not self.awake:
+            return ""
+
+        self.awake = False
+        result = json.loads(self.rec.FinalResult())
+        return result.get("text", "").strip().lower()
+
+    def drop_command(self):
+        """Ends the command window and the utterance in progress, e.g. once
+        the assistant has acted on a partial: anything said after it needs
+        a new wake word and is not merged into the old session."""
+        self.awake = False
+        self.last_partial = ""
+        self.partial_repeats = 0
+        self.rec.Reset()
+        self.wake_rec.Reset()
+        self.wake_buffer.clear()
+        self.vad.reset()
+
+    def reset(self):
+        self.awake = False
+        self.last_partial = ""
+        self.partial_repeats = 0
+        self.rec.Reset()
+        self.wake_rec.Reset()
+        self.wake_buffer.clear()
+        self.vad = VoiceActivityDetector()
+
+# PARENT SIDE
+
+class AsrProcess:
+    """Starts the worker and feeds it. on_event is called from a reader
+    thread with each event; on_exit when the worker goes away."""
+
+    def __init__(self, model_path, cpu=None, partials=True,
+                 on_event=None, on_exit=None):
+        self.model_path = model_path
+        self.cpu = cpu
+        self.partials = partials
+        self.on_event = on_event
+        self.on_exit = on_exit
+        self.ring = SharedAudioRing.create()
+        self.process = None
+        self.ready = threading.Event()
+        self.closing = False
+
+        # One pipe for the life of the assistant: the callback never
+        # writes to a descriptor a restart has just closed
+        self.notify_read, self.notify_write = os.pipe()
+        os.set_blocking(self.notify_write, False)
+
+    def start(self):
+        if self.closing:
+            return
+
+        command = [sys.executable, os.path.abspath(__file__),
+                   "--ring", self.ring.name, "--model", self.model_path]
+        if self.cpu is not None:
+            command += ["--cpu", str(self.cpu)]
+        if not self.partials:
+            command.append("--no-partials")
+
+        self.ready.clear()
+        process = subprocess.Popen(command, stdin=self.notify_read,
+                                   stdout=subprocess.PIPE)
+
+        self.process = process
+        threading.Thread(target=self.pump_events, args=(process,), daemon=True).start()
+
+    def stop(self):
+        process, self.process = self.process, None
+        if process:
+            process.kill()
+            process.wait()
+
+    def alive(self):
+        # A worker exiting because of close() is not a failure to restart
+        return self.closing or (self.process is not None and self.process.poll() is None)
+
+    def wait_ready(self, timeout):
+        """Readiness probe: waits until the worker has its model loaded."""
+        deadline = time.monotonic() + timeout
+        while not self.ready.wait(0.1):
+            if not self.alive():
+                raise RuntimeError("ASR worker exited")
+            if time.monotonic() > deadline:
+                raise TimeoutError("ASR worker did not load the model")
+
+    def write(self, data):
+        """Called from the audio callback."""
+        self.ring.write(data)
+
+        try:
+            os.write(self.notify_write, NOTIFY_BLOCK)
+        except OSError:
+            # Pipe full while the worker is down; the blocks are in the ring
+            pass
+
+    def reset(self):
+        """Has the worker drop the command in progress (see
+        Recognizer.drop_command)."""
+        try:
+            os.write(self.notify_write, NOTIFY_RESET)
+        except OSError:
+            # Worker down: the restarted one starts fresh anyway
+            pass
+
+    def flush(self):
+        self.ring.flush()
+
+    def close(self):
+        """Stops the worker by closing its stdin, so it finishes up and
+        reports its VAD stats; killed if it does not exit in time."""
+        self.closing = True
+        os.close(self.notify_write)
+
+        process, self.process = self.process, None
+        if process:
+            try:
+                process.wait(CLOSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+        os.close(self.notify_read)
+        self.ring.close(unlink=True)
+
+    def pump_events(self, process):
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+
+            if event[0] == "ready":
+                self.ready.set()
+            elif self.on_event:
+                self.on_event(event)
+
+        if self.on_exit:
+            self.on_exit()
+
+# WORKER
+
+def send(event):
+    sys.stdout.buffer.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+    sys.stdout.buffer.flush()
+
+def run_worker(ring_name, model_path, cpu=None, partials=True):
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            print(f"⚠ ASR worker not pinned to CPU {cpu}:", e, file=sys.stderr)
+
+    ring = SharedAudioRing.attach(ring_name)
+    recognizer = Recognizer(vosk.Model(model_path), partials=partials)
+
+    # Audio captured while the model loaded is stale by now
+    ring.skip_to_end()
+    send(["ready"])
+
+    try:
+        while True:
+            # One byte per block written; the ring itself is what is read
+            notices = os.read(sys.stdin.fileno(), 4096)
+            if not notices:
+                break               # the assistant has gone
+
+            if NOTIFY_RESET in notices:
+                recognizer.drop_command()
+
+            while True:
+                block = ring.read()
+                if block is None:
+                    break
+                for event in recognizer.process(block):
+                    send(event)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("📊", recognizer.vad.stats(), file=sys.stderr)
+        ring.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vosk recognizer worker")
+    parser.add_argument("--ring", required=True, help="shared memory name")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--cpu", type=int, help="pin the worker to this core")
+    parser.add_argument("--no-partials", action="store_true")
+    args = parser.parse_args()
+
+    run_worker(args.ring, args.model, args.cpu, not args.no_partials)
@@ -0,0 +1,51 @@
+"""Per-call latency of Hindi number normalization in the time parsers.
+
+Compares the old approach (text.replace() for every entry of the 10,001
+word table) with normalize_numbers(), which looks each word up once.
+
+    python benchmarks/bench_numbers.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hindi_numbers import normalize_numbers, number_to_words
+
+UTTERANCES = [
+    "सात बजकर पैंतालीस मिनट का अलार्म लगाओ",
+    "शाम छह बजे मुझे दवाई लेना याद दिलाना",
+    "पच्चीस मिनट का टाइमर लगाओ",
+    "पंद्रह अगस्त दो हजार चौबीस को कौन सा दिन था",
+]
+REPEATS = 200
+
+# Same shape as the old config_data.json table: word -> digits, 0-10000
+REVERSE_TABLE = {number_to_words(n): str(n) for n in range(10001)}
+
+def replace_loop(text):
+    for word, num in REVERSE_TABLE.items():
+        text = text.replace(word, num)
+    return text
+
+def time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in UTTERANCES:
+            fn(text)
+    return (time.perf_counter() - start) / (repeats * len(UTTERANCES)) * 1e6
+
+def main():
+    for text in UTTERANCES:
+        print(f"{text}\n  replace loop: {replace_loop(text)}\n  tokenized:    {normalize_numbers(text)}")
+
+    before = time_per_call(replace_loop, REPEATS // 10)
+    after = time_per_call(normalize_numbers, REPEATS * 10)
+
+    print(f"\nreplace loop: {before:10.1f} µs/call")
+    print(f"tokenized:    {after:10.1f} µs/call ({before / after:.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
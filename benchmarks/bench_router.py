@@ -0,0 +1,70 @@
+"""Per-utterance routing time of IntentRouter vs. a linear if-cascade.
+
+    python benchmarks/bench_router.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter
+
+INTENT_COUNTS = [10, 30, 100, 300, 1000]
+UTTERANCES = [
+    "लाइट बंद करो",
+    "गाना बंद करो",
+    "पाँच बजे का अलार्म लगाओ",
+    "दस मिनट बाद मुझे दवाई लेना याद दिलाना",
+    "पंद्रह अगस्त दो हजार को कौन सा दिन था",
+    "भारत की राजधानी क्या है",
+]
+REPEATS = 2000
+
+def random_keyword(rng):
+    return "".join(chr(rng.randint(0x0915, 0x0939)) for _ in range(rng.randint(3, 6)))
+
+def build_intents(count, rng):
+    """Returns [(name, groups)] with one or two keyword groups per intent."""
+    intents = []
+    for i in range(count):
+        groups = [[random_keyword(rng) for _ in range(rng.randint(1, 4))]
+                  for _ in range(rng.randint(1, 2))]
+        intents.append((f"intent_{i}", groups))
+    return intents
+
+def linear_route(intents, text):
+    for name, groups in intents:
+        if all(any(k in text for k in group) for group in groups):
+            return name
+    return None
+
+def time_per_call(fn):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for text in UTTERANCES:
+            fn(text)
+    return (time.perf_counter() - start) / (REPEATS * len(UTTERANCES)) * 1e6
+
+def main():
+    rng = random.Random(0)
+
+    print(f"{'intents':>8} {'cascade µs':>12} {'router µs':>12}")
+
+    for count in INTENT_COUNTS:
+        intents = build_intents(count, rng)
+
+        router = IntentRouter()
+        for priority, (name, groups) in enumerate(intents):
+            router.intent(name, *groups, priority=-priority)(lambda text: None)
+        router.compile()
+
+        cascade = time_per_call(lambda text: linear_route(intents, text))
+        compiled = time_per_call(router.match)
+
+        print(f"{count:>8} {cascade:>12.1f} {compiled:>12.1f}")
+
+if __name__ == "__main__":
+    main()
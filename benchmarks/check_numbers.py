@@ -0,0 +1,81 @@
+"""Checks hindi_numbers against the 10,001 word table that config_data.json
+used to ship, loaded from git history.
+
+    python benchmarks/check_numbers.py
+    python benchmarks/check_numbers.py --rev <commit>
+
+Every old word must parse back to its number. Spoken output must match the
+old table, apart from the spellings listed in CHANGED_SPELLINGS. Exits
+non-zero on any other difference.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hindi_numbers import UNITS, number_to_words, set_aliases, words_to_number
+
+# Old spelling -> the one spoken now. The old table spelt 7 and 18 one way
+# on their own (साथ, अट्ठारह) and another inside compounds (एक सौ सात);
+# बचपन for 55 is how the recognizer mishears पचपन.
+CHANGED_SPELLINGS = {
+    "साथ": "सात",
+    "अट्ठारह": "अठारह",
+    "बचपन": "पचपन",
+}
+
+def last_table_revision():
+    """Newest commit whose config_data.json still has the table."""
+    removed = subprocess.run(
+        ["git", "log", "-S", '"hindi_numbers"', "--format=%H", "-1", "--",
+         "config_data.json"],
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    if not removed:
+        raise SystemExit("no commit removing the table found")
+    return removed + "^"
+
+def load_table(rev):
+    text = subprocess.run(["git", "show", f"{rev}:config_data.json"], cwd=ROOT,
+                          capture_output=True, text=True, check=True).stdout
+    return {int(number): word for number, word in json.loads(text)["hindi_numbers"].items()}
+
+def expected_words(word):
+    return " ".join(CHANGED_SPELLINGS.get(part, part) for part in word.split())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rev", help="commit holding the old table")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "config_data.json"), "r", encoding="utf-8") as f:
+        set_aliases(json.load(f).get("number_aliases", {}))
+
+    table = load_table(args.rev or last_table_revision())
+
+    unparsed = [(n, w) for n, w in table.items() if words_to_number(w) != n]
+    respelled = [(n, w, number_to_words(n)) for n, w in table.items()
+                 if number_to_words(n) != w]
+    unexpected = [(n, w, now) for n, w, now in respelled if now != expected_words(w)]
+
+    print(f"{len(table)} entries checked")
+    print(f"{len(unparsed)} old words that do not parse back")
+    print(f"{len(respelled)} numbers spoken differently, "
+          f"{len(respelled) - len(unexpected)} of them from CHANGED_SPELLINGS")
+
+    for n, w in unparsed[:20]:
+        print(f"  parse   {n}: {w} -> {words_to_number(w)}")
+    for n, w, now in unexpected[:20]:
+        print(f"  speak   {n}: {w} -> {now}")
+
+    # The canonical words must also be the ones listed for 0-99
+    assert all(number_to_words(n) == UNITS[n] for n in range(100))
+
+    return 1 if unparsed or unexpected else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
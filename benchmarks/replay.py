@@ -0,0 +1,337 @@
+"""Replays recorded utterances through the voice pipeline, without a mic,
+speaker or GPIO, and reports latency, real-time factor and intent accuracy
+as JSON.
+
+    python benchmarks/replay.py recordings/ > before.json
+    python benchmarks/replay.py recordings/ --block-size 800 > after.json
+
+Each WAV file holds one utterance, wake word included ("वीर लाइट बंद
+करो"). The expected intent comes from labels.json in the same folder
+({"file.wav": "light_off"}) or else from the file name, "light_off__1.wav".
+Use "none" for utterances that should reach the fallback. Files should be
+16-bit mono; other sample rates go through the capture decimator.
+
+Audio is fed as fast as it can be processed. The Vosk model is the real
+one (VOSK_MODEL_PATH, default model/) and the recognizer runs in-process
+rather than in the ASR worker, so stage times are pure compute; TTS, audio
+output and the LED are stubs that only record what they were asked to do.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TAIL_SILENCE = 1.0            # seconds of silence fed after each file
+PERCENTILES = [50, 90, 99]
+
+# STUBS
+
+def install_stubs():
+    """Hardware modules replaced before main.py is imported."""
+    sounddevice = types.ModuleType("sounddevice")
+
+    class Stream:
+        active = True
+        latency = 0.0
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def start(self):
+            pass
+
+        def stop(self):
+            pass
+
+        def close(self):
+            pass
+
+    sounddevice.RawInputStream = Stream
+    sounddevice.RawOutputStream = Stream
+    sounddevice.query_devices = lambda *args, **kwargs: {"default_samplerate": 16000}
+    sys.modules["sounddevice"] = sounddevice
+
+    gpiozero = types.ModuleType("gpiozero")
+
+    class LED:
+        def __init__(self, pin):
+            self.lit = False
+
+        def on(self):
+            self.lit = True
+
+        def off(self):
+            self.lit = False
+
+    gpiozero.LED = LED
+    sys.modules["gpiozero"] = gpiozero
+
+def load_assistant():
+    install_stubs()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        import main
+
+    import vosk
+    from asr_worker import Recognizer
+    from scheduler import Scheduler
+
+    # Nothing from a benchmark run may end up in the real journal
+    main.scheduler = Scheduler()
+    main.load_config()
+    main.init_gpio()
+    main.start_mixer()
+
+    # Handlers run inline so each file's answer is in before the next one
+    main.submit_command = main.run_command
+    main.library.load()
+    main.library.ready.set()
+
+    recognizer = Recognizer(vosk.Model(main.VOSK_MODEL_PATH),
+                            partials=main.STREAMING_INTENTS)
+    main.asr = InlineAsr(recognizer)
+    return main, recognizer
+
+class InlineAsr:
+    """Stands in for main.asr: requests meant for the worker go straight
+    to the in-process recognizer."""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        self.recognizer.drop_command()
+
+# MEASUREMENT
+
+class Recorder:
+    """Wraps pipeline stages of main.py to time them and to catch the
+    intent and the first response of each utterance."""
+
+    def __init__(self, main, recognizer):
+        self.main = main
+        self.stages = {}
+        self.reset()
+
+        for stage, target, name in [("capture", None, None), ("vad", None, None),
+                                    ("recognize", recognizer, "recognize"),
+                                    ("finalize", recognizer, "end_utterance"),
+                                    ("preprocess", main, "preprocess_text"),
+                                    ("route", main.router, "match"),
+                                    # Inline here: the handler and its (stubbed) speech
+                                    ("handler", main, "submit_command")]:
+            self.stages[stage] = []
+            if name:
+                setattr(target, name, self.timed(stage, getattr(target, name)))
+
+        dispatch = main.router.dispatch
+
+        def record_intent(text, *args, **kwargs):
+            name = dispatch(text, *args, **kwargs)
+            self.intents.append(name)
+            return name
+
+        main.router.dispatch = record_intent
+        main.speak = self.respond
+        main.speak_many = lambda sentences, **kwargs: self.respond(" ".join(sentences))
+
+    def reset(self):
+        self.intents = []
+        self.responses = []
+        self.response_at = None         # (audio position, wall time) of the first response
+        self.audio_position = 0.0
+        self.block_started = 0.0
+        self.speech_end = None
+
+    def timed(self, stage, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.stages[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    def respond(self, text, wait=True, on_done=None, **kwargs):
+        self.responses.append(text)
+        if self.response_at is None:
+            self.response_at = (self.audio_position, time.perf_counter() - self.block_started)
+        if on_done:
+            on_done()
+
+def percentiles(values):
+    if not values:
+        return None
+
+    ms = np.array(values) * 1000
+    summary = {f"p{p}": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update(count=len(values), mean=round(float(ms.mean()), 3),
+                   max=round(float(ms.max()), 3))
+    return summary
+
+# REPLAY
+
+def read_labels(folder):
+    path = os.path.join(folder, "labels.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def expected_intent(name, labels):
+    label = labels.get(name)
+    if label is None and "__" in name:
+        label = name.split("__", 1)[0]
+    return None if label in (None, "none") else label
+
+def read_audio(path):
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise ValueError("expected 16-bit mono")
+        return w.getframerate(), w.readframes(w.getnframes())
+
+def replay_file(main, recognizer, recorder, path, block_size):
+    rate, audio = read_audio(path)
+    audio += bytes(int(TAIL_SILENCE * rate) * 2)
+
+    recognizer.reset()
+    main.early_command = None
+    recorder.reset()
+
+    vad = recognizer.vad
+    is_speech = vad.is_speech
+    process = vad.process
+
+    def track_speech(data):
+        speech = is_speech(data)
+        if speech:
+            recorder.speech_end = recorder.audio_position
+        return speech
+
+    vad.is_speech = track_speech
+    vad.process = recorder.timed("vad", process)
+
+    decimator = None
+    in_block = block_size
+    if rate != main.SAMPLE_RATE:
+        in_block = int(block_size * rate / main.SAMPLE_RATE)
+        decimator = main.Decimator(rate, main.SAMPLE_RATE, in_block)
+
+    for start in range(0, len(audio), in_block * 2):
+        chunk = audio[start:start + in_block * 2]
+        recorder.block_started = time.perf_counter()
+        recorder.audio_position = (start // 2 + len(chunk) // 2) / rate
+
+        if decimator:
+            t = time.perf_counter()
+            chunk = decimator.process(chunk).tobytes()
+            recorder.stages["capture"].append(time.perf_counter() - t)
+
+        for event in recognizer.process(chunk):
+            main.handle_asr_event(event)
+
+    return len(audio) // 2 / rate
+
+def run(folder, block_size):
+    main, recognizer = load_assistant()
+    block_size = block_size or main.BLOCK_SIZE
+    recorder = Recorder(main, recognizer)
+    labels = read_labels(folder)
+
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith(".wav"))
+    results = []
+    audio_seconds = 0.0
+    latencies = []
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in files:
+            audio_seconds += replay_file(main, recognizer, recorder,
+                                         os.path.join(folder, name), block_size)
+
+            expected = expected_intent(name, labels)
+            intent = recorder.intents[0] if recorder.intents else None
+
+            result = {"file": name, "expected": expected, "intent": intent,
+                      "correct": intent == expected, "responses": recorder.responses}
+
+            if recorder.response_at and recorder.speech_end is not None:
+                position, processing = recorder.response_at
+                # Audio that had to be heard after the last speech block,
+                # plus the time spent on the block that triggered the answer
+                latency = max(0.0, position - recorder.speech_end) + processing
+                result["latency_ms"] = round(latency * 1000, 1)
+                latencies.append(latency)
+
+            results.append(result)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    correct = sum(r["correct"] for r in results)
+
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"block_size": block_size,
+                   "sample_rate": main.SAMPLE_RATE,
+                   "model": os.path.abspath(main.VOSK_MODEL_PATH),
+                   "streaming_intents": main.STREAMING_INTENTS},
+        "files": len(results),
+        "audio_seconds": round(audio_seconds, 3),
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "real_time_factor": round(wall / audio_seconds, 4) if audio_seconds else None,
+        "cpu_real_time_factor": round(cpu / audio_seconds, 4) if audio_seconds else None,
+        "intent_accuracy": round(correct / len(results), 4) if results else None,
+        "response_latency": percentiles(latencies),
+        "stages": {stage: percentiles(times) for stage, times in recorder.stages.items()},
+        "utterances": results,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="folder of labelled WAV files")
+    parser.add_argument("--block-size", type=int, default=None,
+                        help="samples per block at 16 kHz (default: main.BLOCK_SIZE)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.folder)
+
+    # main.py loads config_data.json and the model relative to the repo
+    os.chdir(ROOT)
+
+    report = run(folder, args.block_size)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
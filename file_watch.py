@@ -0,0 +1,130 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+# FILE WATCHING
+#
+# Calls back when files under some directories change. On Linux this uses
+# inotify through libc, so nothing is polled while the files are untouched;
+# elsewhere, or if inotify cannot be set up, the callback simply runs every
+# poll_interval seconds and is expected to check for changes cheaply itself.
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")   # wd, mask, cookie, name length
+
+def load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class DirectoryWatcher:
+
+    def __init__(self, paths, on_change, recursive=False,
+                 poll_interval=60, debounce=1.0):
+        self.paths = list(paths)
+        self.on_change = on_change      # called with the set of changed paths
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.libc = None
+        self.fd = None
+        self.dirs = {}                  # watch descriptor -> directory
+        self.thread = None
+
+    def start(self):
+        self.libc = load_inotify()
+
+        if self.libc:
+            self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+            if self.fd < 0:
+                self.fd = None
+
+        if self.fd is not None:
+            for path in self.paths:
+                self.add_tree(path)
+            target = self.run_inotify
+        else:
+            print("⚠ inotify not available, polling for changes")
+            target = self.run_polling
+
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def add_tree(self, path):
+        if not os.path.isdir(path):
+            return
+
+        self.add_watch(path)
+
+        if self.recursive:
+            for root, dirs, _ in os.walk(path):
+                for name in dirs:
+                    self.add_watch(os.path.join(root, name))
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def run_polling(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.notify(set())
+
+    def run_inotify(self):
+        changed = set()
+
+        while True:
+            # Collect events until things have been quiet for a moment
+            timeout = self.debounce if changed else None
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+
+            if not ready:
+                self.notify(changed)
+                changed = set()
+                continue
+
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                directory = self.dirs.get(wd)
+                if directory is None:
+                    continue
+
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                changed.add(path)
+
+                if mask & IN_DELETE_SELF:
+                    self.dirs.pop(wd, None)
+                elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self.recursive:
+                    self.add_tree(path)
+
+    def notify(self, changed):
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            print("⚠ File change handler failed:", e)
@@ -0,0 +1,116 @@
+import collections
+import threading
+
+# HANDLER POOL
+#
+# Command handlers run on a few worker threads so the main loop goes
+# straight back to listening. How a handler may overlap with others is set
+# per intent:
+#
+#     serialize   one at a time, in the order heard (the default)
+#     parallel    starts at once on any free worker
+#     preempt     cancels everything running or queued, then starts
+#
+# Cancelling is cooperative: a handler's job only has its cancelled event
+# set, and the places that wait (speech playback, mainly) check it.
+
+POLICIES = ("serialize", "parallel", "preempt")
+
+class Job:
+
+    def __init__(self, name, fn, args, policy):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.policy = policy
+        self.cancelled = threading.Event()
+
+local = threading.local()
+
+def current_job():
+    """The job running on this thread, or None outside the pool."""
+    return getattr(local, "job", None)
+
+class HandlerPool:
+
+    def __init__(self, workers=3):
+        self.cond = threading.Condition()
+        self.ready = collections.deque()    # jobs free to start
+        self.serial = collections.deque()   # serialized jobs waiting their turn
+        self.serial_job = None              # the serialized job started last
+        self.running = set()
+
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def submit(self, fn, *args, policy="serialize", name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}")
+
+        job = Job(name or fn.__name__, fn, args, policy)
+
+        with self.cond:
+            if policy == "preempt":
+                self.cancel_locked()
+                self.ready.appendleft(job)
+            elif policy == "parallel":
+                self.ready.append(job)
+            else:
+                self.serial.append(job)
+                self.start_serial()
+            self.cond.notify_all()
+
+        return job
+
+    def cancel_all(self):
+        """Asks every running handler to stop and drops the queued ones.
+        Returns how many were running."""
+        with self.cond:
+            return self.cancel_locked()
+
+    # INTERNALS
+
+    def cancel_locked(self):
+        for job in list(self.ready) + list(self.serial):
+            job.cancelled.set()
+        self.ready.clear()
+        self.serial.clear()
+
+        for job in self.running:
+            job.cancelled.set()
+
+        if self.serial_job not in self.running:
+            self.serial_job = None
+
+        return len(self.running)
+
+    def start_serial(self):
+        """Called with the lock held: lets the next serialized job start
+        once the one before it has finished."""
+        if self.serial_job is None and self.serial:
+            self.serial_job = self.serial.popleft()
+            self.ready.append(self.serial_job)
+
+    def work(self):
+        while True:
+            with self.cond:
+                while not self.ready:
+                    self.cond.wait()
+                job = self.ready.popleft()
+                self.running.add(job)
+
+            local.job = job
+            try:
+                if not job.cancelled.is_set():
+                    job.fn(*job.args)
+            except Exception as e:
+                print(f"⚠ Handler '{job.name}' failed:", e)
+            finally:
+                local.job = None
+
+                with self.cond:
+                    self.running.discard(job)
+                    if job is self.serial_job:
+                        self.serial_job = None
+                        self.start_serial()
+                    self.cond.notify_all()
@@ -0,0 +1,321 @@
+import functools
+
+# HINDI NUMERALS
+#
+# Rule based conversion between Hindi number words and numbers. Only the
+# irregular words 0-99 are listed; everything above is built from सौ, हजार,
+# लाख and करोड़, the same way the numbers are spoken.
+
+# 0-99 as the assistant speaks them; other spellings come from number_aliases
+UNITS = [
+    "शून्य", "एक", "दो", "तीन", "चार", "पाँच", "छह", "सात", "आठ", "नौ",
+    "दस", "ग्यारह", "बारह", "तेरह", "चौदह", "पंद्रह", "सोलह", "सत्रह", "अठारह", "उन्नीस",
+    "बीस", "इक्कीस", "बाईस", "तेइस", "चौबीस", "पच्चीस", "छब्बीस", "सत्ताइस", "अठ्ठाइस", "उनतीस",
+    "तीस", "इकतीस", "बत्तीस", "तैंतीस", "चौंतीस", "पैंतीस", "छत्तीस", "सैंतीस", "अड़तीस", "उनतालीस",
+    "चालीस", "इकतालीस", "बयालीस", "तैंतालिस", "चवालिस", "पैंतालीस", "छियालीस", "सैंतालिस", "अड़तालीस", "उनचास",
+    "पचास", "इक्यावन", "बावन", "तिरपन", "चौवन", "पचपन", "छप्पन", "सत्तावन", "अट्ठावन", "उनसठ",
+    "साठ", "इकसठ", "बासठ", "तिरसठ", "चौंसठ", "पैंसठ", "छियासठ", "सड़सठ", "अड़सठ", "उनहत्तर",
+    "सत्तर", "इकहत्तर", "बहत्तर", "तिहत्तर", "चौहत्तर", "पचहत्तर", "छिहत्तर", "सतहत्तर", "अठहत्तर", "उनासी",
+    "अस्सी", "इक्यासी", "बयासी", "तिरासी", "चौरासी", "पचासी", "छियासी", "सत्तासी", "अट्ठासी", "नवासी",
+    "नब्बे", "इक्यानवे", "बानवे", "तिरानवे", "चौरानवे", "पचानवे", "छियानवे", "सत्तानवे", "अट्ठानवे", "निन्यानवे",
+]
+
+# Largest first, used when speaking a number
+SCALE_WORDS = [
+    (10000000, "करोड़"),
+    (100000, "लाख"),
+    (1000, "हजार"),
+    (100, "सौ"),
+]
+
+SCALES = {word: value for value, word in SCALE_WORDS}
+SCALES.update({"हज़ार": 1000, "करोड": 10000000})
+
+DECIMAL_WORD = "दशमलव"
+NEGATIVE_WORDS = ["माइनस", "ऋण"]
+DECIMAL_PLACES = 2
+
+# Value ranges for fuzzy matching of misheard number words
+FUZZY_DOMAINS = {
+    "day": range(1, 32),
+    "hour": range(0, 25),
+    "minute": range(0, 60),
+    "number": range(0, 100),
+}
+
+class NumberTable:
+    """Word -> value for 0-99, extended with spellings from
+    config_data.json, with its fuzzy indexes and fuzzy match cache. Never
+    changed once built: a reload builds a new table and swaps TABLE, so a
+    lookup on another thread sees either the old table or the new one."""
+
+    def __init__(self, aliases):
+        self.values = {word: value for value, word in enumerate(UNITS)}
+        for word, value in aliases.items():
+            self.values[word] = int(value)
+
+        self.indexes = {domain: build_fuzzy_index(self.values, domain)
+                        for domain in FUZZY_DOMAINS}
+        self.fuzzy = functools.lru_cache(maxsize=1024)(self.fuzzy_uncached)
+
+    def word_value(self, word):
+        if word.isdigit():
+            return int(word)
+        return self.values.get(word)
+
+    def fuzzy_uncached(self, word, domain, max_distance):
+        value = self.word_value(word)
+        if value is not None:
+            return (value, 0) if value in FUZZY_DOMAINS[domain] else None
+
+        if max_distance is None:
+            max_distance = len(word) / 3
+
+        candidates = self.indexes[domain].search(word, max_distance)
+        if not candidates:
+            return None
+
+        # Closest first; ASR errors tend to keep the start of the word
+        distance, _, value = min(candidates, key=lambda c: (c[0], -common_prefix(word, c[1]), c[2]))
+        return value, distance
+
+def set_aliases(aliases):
+    """Replaces the extra spellings."""
+    global TABLE
+    TABLE = NumberTable(aliases)
+
+def word_value(word):
+    """Value of a single 0-99 number word or digit string, else None."""
+    return TABLE.word_value(word)
+
+# NUMBER -> WORDS
+
+def number_to_words(number):
+    if isinstance(number, float):
+        # 2.999 is spoken as तीन, not तीन दशमलव with nothing after it
+        number = round(number, DECIMAL_PLACES)
+        if number.is_integer():
+            number = int(number)
+
+    if number < 0:
+        return f"{NEGATIVE_WORDS[0]} {number_to_words(-number)}"
+
+    if isinstance(number, float):
+        whole, fraction = f"{number:.{DECIMAL_PLACES}f}".rstrip("0").split(".")
+        digits = " ".join(UNITS[int(d)] for d in fraction)
+        return f"{number_to_words(int(whole))} {DECIMAL_WORD} {digits}"
+
+    number = int(number)
+
+    if number < 100:
+        return UNITS[number]
+
+    # A plain hundred / thousand is said without "एक"
+    if number in (100, 1000):
+        return "सौ" if number == 100 else "हजार"
+
+    parts = []
+    for value, word in SCALE_WORDS:
+        if number >= value:
+            count, number = divmod(number, value)
+            parts.append(f"{number_to_words(count)} {word}")
+
+    if number:
+        parts.append(UNITS[number])
+
+    return " ".join(parts)
+
+# WORDS -> NUMBER
+
+def find_numbers(words):
+    """Returns (start, end, value) for every run of number words in words."""
+    table = TABLE                       # one table for the whole sentence
+    spans = []
+    start = None
+    total = current = 0
+    last_was_unit = False
+    i = 0
+
+    while i < len(words):
+        word = words[i]
+        value = table.word_value(word)
+
+        if value is not None:
+            # "दो तीन" is two numbers, "दो सौ तीन" is one
+            if start is not None and last_was_unit:
+                spans.append((start, i, total + current))
+                start = None
+
+            if start is None:
+                start, total, current = i, 0, 0
+
+            current += value
+            last_was_unit = True
+
+        elif word in SCALES:
+            if start is None:
+                start, total, current = i, 0, 0
+
+            scale = SCALES[word]
+            if scale == 100:
+                current = (current or 1) * 100
+            else:
+                total += (current or 1) * scale
+                current = 0
+            last_was_unit = False
+
+        elif word == DECIMAL_WORD and start is not None and \
+                i + 1 < len(words) and table.word_value(words[i + 1]) is not None:
+            fraction = ""
+            i += 1
+            while i < len(words) and table.word_value(words[i]) is not None:
+                fraction += str(table.word_value(words[i]))
+                i += 1
+
+            spans.append((start, i, total + current + float("0." + fraction)))
+            start = None
+            continue
+
+        elif start is not None:
+            spans.append((start, i, total + current))
+            start = None
+
+        i += 1
+
+    if start is not None:
+        spans.append((start, len(words), total + current))
+
+    return spans
+
+def extract_numbers(text):
+    return [value for _, _, value in find_numbers(text.split())]
+
+def words_to_number(text):
+    """Value of the first number in text, e.g. "माइनस दो सौ पाँच" -> -205."""
+    words = text.split()
+    negative = bool(words) and words[0] in NEGATIVE_WORDS
+
+    spans = find_numbers(words[1:] if negative else words)
+    if not spans:
+        return None
+
+    value = spans[0][2]
+    return -value if negative else value
+
+def normalize_numbers(text):
+    """Rewrites every number in text as digits in one pass over the words,
+    e.g. "सात बजकर पैंतालीस" -> "7 बजकर 45"."""
+    words = text.split()
+    spans = find_numbers(words)
+
+    if not spans:
+        return " ".join(words)
+
+    parts = []
+    position = 0
+    for start, end, value in spans:
+        parts.extend(words[position:start])
+        parts.append(str(value))
+        position = end
+    parts.extend(words[position:])
+
+    return " ".join(parts)
+
+# FUZZY MATCHING
+
+# Halant, nukta and nasal marks are what ASR most often gets wrong, so
+# they only count half
+LIGHT_MARKS = "़्ंँः"
+
+def edit_distance(a, b):
+    # Costs are doubled while computing so the table stays integer
+    cost_b = [1 if char in LIGHT_MARKS else 2 for char in b]
+
+    previous = [0]
+    for cost in cost_b:
+        previous.append(previous[-1] + cost)
+
+    for char_a in a:
+        light_a = char_a in LIGHT_MARKS
+        cost_a = 1 if light_a else 2
+        left = previous[0] + cost_a
+        current = [left]
+
+        for j, char_b in enumerate(b):
+            if char_a == char_b:
+                diagonal = previous[j]
+            elif light_a or cost_b[j] == 1:
+                diagonal = previous[j] + 1
+            else:
+                diagonal = previous[j] + 2
+
+            left = min(previous[j + 1] + cost_a, left + cost_b[j], diagonal)
+            current.append(left)
+
+        previous = current
+
+    return previous[-1] / 2
+
+class BKTree:
+    """Burkhard-Keller tree: finds all words within an edit distance
+    without comparing against every word."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word, value):
+        if self.root is None:
+            self.root = (word, value, {})
+            return
+
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[2]:
+                node[2][distance] = (word, value, {})
+                return
+            node = node[2][distance]
+
+    def search(self, word, max_distance):
+        """Returns [(distance, word, value)] within max_distance."""
+        found = []
+        nodes = [self.root] if self.root else []
+
+        while nodes:
+            node_word, value, children = nodes.pop()
+            distance = edit_distance(word, node_word)
+
+            if distance <= max_distance:
+                found.append((distance, node_word, value))
+
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    nodes.append(child)
+
+        return found
+
+def build_fuzzy_index(word_values, domain):
+    values = FUZZY_DOMAINS[domain]
+    tree = BKTree()
+    for word, value in word_values.items():
+        if value in values:
+            tree.add(word, value)
+    return tree
+
+def common_prefix(a, b):
+    length = 0
+    for char_a, char_b in zip(a, b):
+        if char_a != char_b:
+            break
+        length += 1
+    return length
+
+def fuzzy_number(word, domain="number", max_distance=None):
+    """Best (value, distance) for a misheard number word in a domain of
+    FUZZY_DOMAINS, or None when nothing is close enough. By default up to a
+    third of the word may differ."""
+    return TABLE.fuzzy(word, domain, max_distance)
+
+TABLE = NumberTable({})
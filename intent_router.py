@@ -0,0 +1,172 @@
+# INTENT ROUTER
+#
+# Intents are declared once with their keyword groups and a priority. All
+# keywords of all intents are compiled into a single Aho-Corasick automaton,
+# so routing an utterance is one pass over the text no matter how many
+# intents are registered.
+
+
+class WordGroup(tuple):
+    """Keyword group that only matches whole words, not substrings."""
+
+
+def words(*keywords):
+    return WordGroup(keywords)
+
+
+class Intent:
+
+    def __init__(self, name, groups, priority, handler, policy):
+        self.name = name
+        self.groups = groups
+        self.priority = priority
+        self.handler = handler
+        self.policy = policy
+
+
+class IntentRouter:
+
+    def __init__(self):
+        self.intents = []
+        self.fallback_handler = None
+        self.compiled = False
+        self.on_match = None        # called with each intent before its handler
+
+    # REGISTRATION
+
+    def intent(self, name, *groups, priority=0, policy="serialize"):
+        """Decorator: the handler runs when at least one keyword of every
+        group is present. Handlers return False to pass the utterance on to
+        the next best matching intent. policy says how the handler may
+        overlap with others (see handler_pool.py)."""
+
+        def register(handler):
+            groups_list = [g if isinstance(g, WordGroup) else tuple(g)
+                           for g in groups]
+            self.intents.append(Intent(name, groups_list, priority, handler, policy))
+            self.compiled = False
+            return handler
+
+        return register
+
+    def fallback(self, handler):
+        self.fallback_handler = handler
+        return handler
+
+    # COMPILATION
+
+    def compile(self):
+        # keyword -> [(intent index, group index, whole word)]
+        self.keyword_groups = {}
+
+        for i, intent in enumerate(self.intents):
+            for g, group in enumerate(intent.groups):
+                whole_word = isinstance(group, WordGroup)
+                for keyword in group:
+                    self.keyword_groups.setdefault(keyword, []).append(
+                        (i, g, whole_word))
+
+        self.build_automaton(self.keyword_groups)
+        self.compiled = True
+
+    def build_automaton(self, keywords):
+        # Trie as a list of {char: state} dicts, plus failure links and the
+        # keywords that end at each state.
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(keyword)
+
+        # Breadth-first pass to fill in failure links
+        queue = list(self.goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + \
+                    self.output[self.fail[next_state]]
+
+    # MATCHING
+
+    def find_keywords(self, text):
+        """Returns {(keyword, whole_word)} for every keyword found in text."""
+        found = set()
+        state = 0
+
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+
+            for keyword in self.output[state]:
+                found.add((keyword, False))
+
+                start = end - len(keyword) + 1
+                if (start == 0 or text[start - 1] == " ") and \
+                        (end + 1 == len(text) or text[end + 1] == " "):
+                    found.add((keyword, True))
+
+        return found
+
+    def match(self, text):
+        """Returns the intents satisfied by text, best first."""
+        if not self.compiled:
+            self.compile()
+
+        satisfied = {}
+        score = {}
+
+        for keyword, whole_word in self.find_keywords(text):
+            for i, g, needs_word in self.keyword_groups[keyword]:
+                if needs_word and not whole_word:
+                    continue
+                satisfied.setdefault(i, set()).add(g)
+                score[i] = score.get(i, 0) + len(keyword)
+
+        matches = [i for i, groups in satisfied.items()
+                   if len(groups) == len(self.intents[i].groups)]
+
+        # Explicit priority first, then the more specific (longer) match
+        matches.sort(key=lambda i: (-self.intents[i].priority, -score[i], i))
+
+        return [self.intents[i] for i in matches]
+
+    def dispatch(self, text, matches=None, redirect=None):
+        """Runs the best matching handler and returns its intent name.
+        matches is match(text), when the caller already has it. With
+        redirect, text passed on to an intent whose policy differs from
+        the first match's goes to redirect(text, remaining matches)
+        instead, and None is returned."""
+        if matches is None:
+            matches = self.match(text)
+
+        for n, intent in enumerate(matches):
+            if redirect and intent.policy != matches[0].policy:
+                redirect(text, matches[n:])
+                return None
+            if self.on_match:
+                self.on_match(intent)
+            if intent.handler(text) is not False:
+                return intent.name
+
+        if self.fallback_handler:
+            self.fallback_handler(text)
+
+        return None
+
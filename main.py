@@ -1,41 +1,106 @@
 import os
 import sys
 import json
-import queue
 import datetime
 import time
 import subprocess
 import sounddevice as sd
-import vosk
 import threading
 import random
 import re
-import signal
+import collections
+import queue
+import numpy as np
 from gpiozero import LED
+from intent_router import IntentRouter, words
+from scheduler import Scheduler, ScheduleStore
+from tts_cache import PhraseCache
+from mixer import Mixer, StreamSource, load_track
+from playlist import Playlist
+from supervisor import Supervisor
+from tracing import Tracer
+from music_library import MusicLibrary
+from asr_worker import AsrProcess, BLOCK_SIZE, SAMPLE_RATE, WAKE_WORDS
+from file_watch import DirectoryWatcher
+from handler_pool import HandlerPool, current_job
+from hindi_numbers import (extract_numbers, fuzzy_number, normalize_numbers,
+                           number_to_words, set_aliases, words_to_number)
 
 # GLOBALS
 
-is_song_paused = False
-song_list = []
-current_song_index = -1
-q = queue.Queue()
 piper_process = None
-aplay_process = None
+piper_service = None
+mixer = None
+supervisor = Supervisor()
+tracer = Tracer()
+phrase_cache = None
+tts_sink = None
 is_speaking = False
+speaking_count = 0
+speaking_lock = threading.Lock()
 last_response_time = 0
-COOLDOWN_TIME = 0.5
-timer_active = False
-timer_thread = None
-reminder_active = False
-reminder_thread = None
+# One speaker on the sink at a time, so handlers running in parallel take
+# turns instead of talking over each other, and clearing the sink only
+# ever drops the cancelled speaker's own audio.
+voice_lock = threading.Lock()
+
+# Speech completion: audio written to the mixer is timed against the sample rate
+TTS_SAMPLE_RATE = 22050
+TTS_SINK_LATENCY = 0.15       # mixer / ALSA buffering before sound comes out
+PIPER_FIRST_AUDIO_TIMEOUT = 5 # seconds to wait for piper to start producing audio
+PIPER_IDLE_GAP = 0.15         # no new piper audio for this long = synthesis done
+ECHO_TAIL = 0.2               # mic stays muted this long after playback ends
+
+# Startup readiness probes
+PIPER_PROBE_TEXT = "नमस्ते"
+PIPER_READY_TIMEOUT = 60      # first model load on a cold SD card is slow
+AUDIO_READY_TIMEOUT = 10
+piper_last_output = 0.0
+# piper's audio can also be collected, e.g. for the phrase cache; muted,
+# it is collected instead of played
+piper_capture = None
+piper_muted = False
+piper_starts = 0                # a capture spanning a restart is incomplete
+capture_start = 0
+
+# While piper is being restarted text is queued and sent once it is back
+PIPER_RESTART_WAIT = 30       # longest speak() waits for a restarting piper
+PENDING_UTTERANCES_MAX = 20
+pending_utterances = collections.deque(maxlen=PENDING_UTTERANCES_MAX)
+piper_lock = threading.Lock()
+
+# Multi-sentence answers: sentences are fed to piper while the previous one
+# plays, keeping at most SPEAK_LOOKAHEAD seconds queued so a wake word can
+# cut the answer short.
+SENTENCE_PAUSE = 0.3
+SPEAK_LOOKAHEAD = 1.0
+speech_cancel = threading.Event()
+barge_in = False
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 SONG_FOLDER = os.path.join(CURRENT_DIR, "songs")
-song_process = None
-is_song_playing = False
-alarm_thread = None
-alarm_active = False
-alarm_process = None
+playlist = None
+alarm_source = None
+# MP3s decoded for the mixer, kept under mixer.CACHE_MAX_BYTES
+AUDIO_CACHE_DIR = os.path.join(CURRENT_DIR, "audio_cache")
+# Song index, so playback never has to list the songs folder
+LIBRARY_INDEX_FILE = os.path.join(CURRENT_DIR, "music_index.json")
+LIBRARY_WAIT = 5              # seconds to wait for the very first scan
+library = MusicLibrary(SONG_FOLDER, LIBRARY_INDEX_FILE)
+# Words of a song request that are not part of the name
+SONG_QUERY_STOPWORDS = {
+    "वीर", "का", "की", "के", "गाना", "गाने", "गीत", "संगीत", "सॉन्ग", "song",
+    "चलाओ", "चला", "चलाना", "सुनाओ", "सुना", "बजाओ", "बजा", "लगाओ", "लगा",
+    "प्ले", "play", "करो", "कर", "दो", "दे", "कोई", "एक", "मुझे", "मेरा",
+    "वाला", "वाली", "वाले", "प्लीज", "प्लीज़", "जरा", "ज़रा", "भी", "तो", "सा", "और",
+    "अच्छा", "अच्छी", "बढ़िया",
+}
 last_spoken_text = ""
+router = IntentRouter()
+
+# Handlers run off the main loop; each intent's policy (serialize, parallel
+# or preempt) says how it may overlap with others
+HANDLER_WORKERS = 3
+handlers = HandlerPool(HANDLER_WORKERS)
 ALARM_KEYWORDS = [
     "अलार्म",
     "आलार्म",
@@ -44,8 +109,80 @@ ALARM_KEYWORDS = [
 ]
 
 CONFIG_FILE = "config_data.json"
-VOSK_MODEL_PATH = "model"
-WAKE_WORDS = ["veer", "वीर"]
+
+# Edits to the config are picked up while running; polling is only used
+# where inotify is not available
+CONFIG_DEBOUNCE = 0.2
+CONFIG_POLL_INTERVAL = 1.0
+
+# Per-utterance latency traces: metrics on a local socket, one JSON line
+# per utterance in a rotating log
+TRACE_SOCKET = "/tmp/veer_metrics.sock"
+TRACE_LOG = os.path.join(CURRENT_DIR, "logs", "trace.log")
+SCHEDULE_FILE = "schedule_journal.jsonl"
+
+# Pre-rendered TTS, kept from piper's own output: fixed confirmations once
+# piper is up, other phrases once they repeat, up to TTS_CACHE_MAX_DYNAMIC
+# of them.
+PIPER_PATH = os.path.join(CURRENT_DIR, "piper", "piper")
+PIPER_MODEL_PATH = os.path.join(CURRENT_DIR, "hi_IN-pratham-medium.onnx")
+TTS_CACHE_DIR = os.path.join(CURRENT_DIR, "tts_cache")
+TTS_CACHE_MAX_DYNAMIC = 200
+FIXED_PHRASES = [
+    "वीर आपकी सहायता के लिए तैयार है",
+    "क्षमा करें, मैं इसमें आपकी सहायता नहीं कर सकता",
+    "अलार्म बज रहा है",
+    "अलार्म बंद कर दिया गया है",
+    "कितने बजे का अलार्म लगाना है?",
+    "टाइमर बंद कर दिया",
+    "कितने मिनट का टाइमर लगाना है?",
+    "कितने मिनट बाद याद दिलाना है?",
+    "रिमाइंडर रद्द कर दिया गया है",
+    "गाना चला रहा हूँ",
+    "गाना बंद कर दिया",
+    "गाना रोक दिया",
+    "गाना फिर से चालू किया",
+    "कोई गाना नहीं मिला",
+    "कुछ भी चालू नहीं है",
+    "लाइट चालू कर दी",
+    "लाइट बंद कर दी",
+    "भारत के प्रधानमंत्री नरेंद्र मोदी हैं",
+    "भारत की राजधानी नई दिल्ली है",
+]
+
+# What to do with jobs that came due while the assistant was off:
+# "fire" runs them late, "report" announces them, "drop" forgets them.
+# Jobs missed by less than MISSED_JOB_GRACE seconds always fire.
+MISSED_JOB_POLICY = {
+    "alarm": "report",
+    "timer": "report",
+    "reminder": "fire",
+}
+MISSED_JOB_GRACE = 300
+
+scheduler = Scheduler(ScheduleStore(SCHEDULE_FILE))
+VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "model")
+
+# Recognition runs in a worker process (asr_worker.py), which can be kept
+# on a core of its own
+ASR_CPU = None                # e.g. 3 on a Pi 4; None lets the kernel choose
+ASR_READY_TIMEOUT = 120       # model load on a cold SD card is slow
+
+# Streaming intents: short, complete commands are run from the partial
+# hypothesis as soon as it is stable instead of waiting for end of utterance.
+STREAMING_INTENTS = True
+EARLY_COMMANDS = [
+    "टाइम",
+    "समय",
+    "कितने बजे हैं",
+    "गाना बंद करो",
+    "गाना रोको",
+    "लाइट चालू करो",
+    "लाइट बंद करो",
+    "बत्ती चालू करो",
+    "बत्ती बंद करो",
+    "अलार्म बंद करो",
+]
 HINDI_DAY_TO_INDEX = {
     "सोमवार": 0,
     "मंगलवार": 1,
@@ -95,64 +232,460 @@ ENGLISH_TO_HINDI_MONTH = {
 }
 
 LED_PIN = 17
+light_led = None
 
-try:
-    light_led = LED(LED_PIN)
-except Exception as e:
-    print("⚠ LED initialization failed:", e)
-    light_led = None
+def init_gpio():
+    global light_led
 
+    try:
+        light_led = LED(LED_PIN)
+    except Exception as e:
+        print("⚠ LED initialization failed:", e)
+
+config_stamp = None                 # (mtime, size) of the last config read
+
+def check_config(data):
+    """Raises ValueError if the config would not load cleanly. Only
+    number_aliases is read from it at the moment."""
+    if not isinstance(data, dict):
+        raise ValueError("not a JSON object")
+
+    aliases = data.get("number_aliases", {})
+    if not isinstance(aliases, dict):
+        raise ValueError("number_aliases is not an object")
+    for word, value in aliases.items():
+        if not word.strip() or len(word.split()) != 1:
+            raise ValueError(f"number alias {word!r} is not a single word")
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"number alias {word!r} has value {value!r}")
+
+def config_file_stamp():
+    stat = os.stat(CONFIG_FILE)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_config():
+    """Loads config_data.json, keeping the tables already in use if the
+    file cannot be read or does not pass check_config()."""
+    global config_stamp
+
+    first = config_stamp is None
+    try:
+        config_stamp = config_file_stamp()
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        check_config(data)
+    except (OSError, ValueError) as e:
+        print("⚠ Config not loaded:", e)
+        if first:
+            set_aliases({})
+        return False
+
+    set_aliases(data.get("number_aliases", {}))
+    return True
+
+def watch_config():
+    """Reloads the config in the background whenever the file changes."""
+    path = os.path.abspath(CONFIG_FILE)
+
+    def on_change(changed):
+        # inotify reports paths; the polling fallback reports nothing
+        if changed and path not in changed:
+            return
+        try:
+            if config_file_stamp() == config_stamp:
+                return
+        except OSError:
+            return                      # being replaced; the next event has it
 
-HINDI_NUMS = {}
-REVERSE_HINDI = {}
+        start = time.monotonic()
+        if load_config():
+            print(f"🔄 Config reloaded in {(time.monotonic() - start) * 1000:.0f} ms")
 
-try:
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        HINDI_NUMS = data.get("hindi_numbers", {})
-        REVERSE_HINDI = {v: k for k, v in HINDI_NUMS.items()}
-except Exception as e:
-    print("⚠ Number dictionary not loaded:", e)
+    watcher = DirectoryWatcher([os.path.dirname(path)], on_change,
+                               poll_interval=CONFIG_POLL_INTERVAL,
+                               debounce=CONFIG_DEBOUNCE)
+    watcher.start()
+    return watcher
 
 # TTS
 
+class TtsSink:
+    """Writes PCM to the mixer's voice bus and keeps track of when it
+    finishes playing."""
+
+    def __init__(self, source, rate=TTS_SAMPLE_RATE, latency=TTS_SINK_LATENCY):
+        self.source = source
+        self.bytes_per_second = rate * 2
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.play_end = 0.0
+        self.last_write = 0.0
+        self.trace = None               # trace key of the current speaker
+
+    def write(self, data):
+        if self.trace and tracer.active("tts_first_byte", self.trace):
+            tracer.mark("tts_first_byte", self.trace)
+
+        with self.lock:
+            self.source.write(data)
+
+            now = time.monotonic()
+            start = max(now + self.latency, self.play_end)
+            self.play_end = start + len(data) / self.bytes_per_second
+            self.last_write = now
+
+    def clear(self):
+        """Drops audio that has not been played yet."""
+        with self.lock:
+            self.source.clear()
+            self.play_end = time.monotonic()
+
+    def remaining(self):
+        """Seconds of written audio still to be played."""
+        return max(0.0, self.play_end - time.monotonic())
+
+def start_mixer():
+    global mixer, playlist
+
+    mixer = Mixer()
+    playlist = Playlist(mixer, load_song, on_track=song_started, on_end=playlist_ended)
+
+    supervisor.add("audio output", start_audio_output, mixer.stop, mixer.alive)
+
+def start_audio_output():
+    mixer.start()
+
+    if tts_sink:
+        tts_sink.latency = mixer.latency()
+
 def start_tts():
-    global piper_process, aplay_process
+    global piper_service, phrase_cache, tts_sink
 
-    piper_path = os.path.join(CURRENT_DIR, "piper", "piper")
-    model_path = os.path.join(CURRENT_DIR, "hi_IN-pratham-medium.onnx")
+    # piper's audio goes through us so cached phrases can share the sink
+    # and playback can be timed
+    voice = mixer.add(StreamSource(TTS_SAMPLE_RATE, bus="voice"))
+    tts_sink = TtsSink(voice)
 
-    piper_process = subprocess.Popen(
-        [piper_path, "--model", model_path, "--output-raw"],
+    piper_service = supervisor.add("piper", start_piper, stop_piper, piper_alive)
+
+    phrase_cache = PhraseCache(TTS_CACHE_DIR, PIPER_MODEL_PATH,
+                               max_dynamic=TTS_CACHE_MAX_DYNAMIC)
+
+def start_piper():
+    global piper_process, piper_starts
+
+    process = subprocess.Popen(
+        [PIPER_PATH, "--model", PIPER_MODEL_PATH, "--output-raw"],
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE
     )
+    threading.Thread(target=pump_tts_audio, args=(process,), daemon=True).start()
 
-    aplay_process = subprocess.Popen(
-        ["aplay", "-D", "plug:dmix", "-r", "22050",
-         "-f", "S16_LE", "-t", "raw"],
-        stdin=piper_process.stdout
-    )
+    with piper_lock:
+        piper_process = process
+        piper_starts += 1
 
-def speak(text):
-    global is_speaking, last_response_time, last_spoken_text
+        # Whatever was said while piper was down
+        while pending_utterances:
+            process.stdin.write((pending_utterances.popleft() + "\n").encode("utf-8"))
+        process.stdin.flush()
+
+def stop_piper():
+    if piper_process:
+        piper_process.kill()
+        piper_process.wait()
+
+def piper_alive():
+    return piper_process is not None and piper_process.poll() is None
+
+def send_to_piper(text):
+    """Hands text to piper, or queues it if piper is down."""
+    error = None
+
+    with piper_lock:
+        # Not the supervisor's flag: that is only set once start_piper()
+        # has returned, after it has sent the queue
+        if piper_alive():
+            try:
+                piper_process.stdin.write((text + "\n").encode("utf-8"))
+                piper_process.stdin.flush()
+                return True
+            except (OSError, ValueError) as e:
+                error = e
+
+        pending_utterances.append(text)
+
+    # Outside piper_lock: the supervisor takes it when restarting piper
+    if error:
+        supervisor.report_failure(piper_service, f"write failed: {error}")
+    return False
+
+def pump_tts_audio(process):
+    global piper_last_output
+
+    fd = process.stdout.fileno()
+
+    while True:
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            break
+
+        capture = piper_capture
+        if capture is not None:
+            capture += chunk
+        if not piper_muted:
+            tts_sink.write(chunk)
+        piper_last_output = time.monotonic()
+
+    # piper exited; no need to wait for the next health check
+    supervisor.check_now()
+
+def start_capture():
+    global piper_capture, capture_start
+    capture_start = piper_starts
+    piper_capture = bytearray()
+
+def end_capture():
+    """The audio piper produced since start_capture(), or nothing if it was
+    restarted meanwhile."""
+    global piper_capture, piper_muted
+    pcm = bytes(piper_capture) if piper_starts == capture_start else b""
+    piper_capture = None
+    piper_muted = False
+    return pcm
+
+def render_phrase(text, timeout=PIPER_FIRST_AUDIO_TIMEOUT):
+    """Has piper synthesize text without playing it and returns the audio.
+    The caller holds voice_lock, so everything piper says meanwhile is
+    this text."""
+    global piper_muted
+
+    start_capture()
+    piper_muted = True
+    sent_at = time.monotonic()
+    send_to_piper(text)
+
+    try:
+        while piper_last_output < sent_at:
+            if time.monotonic() - sent_at > timeout:
+                raise TimeoutError("piper did not answer")
+            time.sleep(0.02)
+
+        while time.monotonic() - piper_last_output < PIPER_IDLE_GAP:
+            time.sleep(0.02)
+    finally:
+        pcm = end_capture()
+
+    return pcm
+
+def probe_piper():
+    """Readiness probe: waits until piper has its model loaded by having it
+    synthesize a word, whose audio is thrown away. Then renders the fixed
+    phrases not cached yet in the background."""
+    with voice_lock:
+        render_phrase(PIPER_PROBE_TEXT, PIPER_READY_TIMEOUT)
+
+    threading.Thread(target=render_fixed_phrases, daemon=True).start()
+
+def render_fixed_phrases():
+    # One phrase at a time, so speech waits for one at most
+    for text in phrase_cache.pin(FIXED_PHRASES):
+        try:
+            with voice_lock:
+                pcm = render_phrase(text)
+        except TimeoutError:
+            print("⚠ Fixed phrases not rendered: piper did not answer")
+            return
+        phrase_cache.store(text, pcm)
+
+def wait_for_audio_output():
+    """Readiness probe for the mixer's output stream."""
+    deadline = time.monotonic() + AUDIO_READY_TIMEOUT
+    while not mixer.alive():
+        if time.monotonic() > deadline:
+            raise TimeoutError("audio output did not open")
+        time.sleep(0.02)
+
+def wait_for_piper_output(sent_at):
+    """Blocks until piper has produced all audio for text sent at sent_at."""
+    deadline = sent_at + PIPER_FIRST_AUDIO_TIMEOUT
+
+    while tts_sink.last_write < sent_at:
+        now = time.monotonic()
+        # A restarting piper will still speak the queued text
+        if now > deadline and (piper_service.running or now > sent_at + PIPER_RESTART_WAIT):
+            print("⚠ No audio from piper")
+            return
+        time.sleep(0.02)
+
+    while True:
+        idle = time.monotonic() - tts_sink.last_write
+        if idle >= PIPER_IDLE_GAP:
+            return
+        time.sleep(PIPER_IDLE_GAP - idle)
+
+def wait_for_playback(job=None):
+    """Blocks until the sink has played out. If job is cancelled meanwhile
+    the rest of the audio is dropped instead."""
+    while tts_sink.remaining() > 0:
+        if job is not None and job.cancelled.is_set():
+            print("🛑 Speech interrupted")
+            tts_sink.clear()
+            return
+        time.sleep(min(0.05, max(0.02, tts_sink.remaining())))
+
+def claim_voice(job):
+    """Waits for the sink to be free. False if job is cancelled first."""
+    while not voice_lock.acquire(timeout=0.05):
+        if job is not None and job.cancelled.is_set():
+            return False
+    return True
+
+def set_speaking(active):
+    global is_speaking, speaking_count, last_response_time
+
+    with speaking_lock:
+        speaking_count += 1 if active else -1
+        is_speaking = speaking_count > 0
+
+        if not active:
+            last_response_time = time.time()
+
+def speak(text, wait=True, on_done=None):
+    """Speaks text. With wait=True returns once the audio has played;
+    otherwise returns at once and calls on_done when playback ends."""
+    global last_spoken_text
+
+    job = current_job()
+    if not claim_voice(job):
+        return
 
     print("🗣️", text)
 
+    # Speech of a command is timed in that command's trace
+    trace = tts_sink.trace = tracer.bound()
+    if trace:
+        tracer.mark("tts_request", trace)
     last_spoken_text = text.lower()
-    is_speaking = True
+    set_speaking(True)
+
+    if asr:
+        asr.flush()
+
+    pcm = phrase_cache.get(text) if phrase_cache else None
+    keep = False
+    sent_at = time.monotonic()
+
+    if pcm is not None:
+        # Pre-rendered: no synthesis, straight to the sink
+        tts_sink.write(pcm)
+    else:
+        # A phrase worth caching is kept from piper's output as it plays
+        keep = phrase_cache.note_spoken(text) if phrase_cache else False
+        if keep:
+            start_capture()
+        send_to_piper(text)
+
+    def finish():
+        if pcm is None:
+            wait_for_piper_output(sent_at)
+        if keep:
+            phrase_cache.store(text, end_capture())
+        wait_for_playback(job)
+
+        if trace:
+            tracer.mark("tts_end", trace)
+
+        # Let the room echo die down before the mic opens again
+        time.sleep(ECHO_TAIL)
+        set_speaking(False)
+        voice_lock.release()
+
+        if on_done:
+            on_done()
+
+    if wait:
+        finish()
+    else:
+        threading.Thread(target=finish, daemon=True).start()
+
+def speak_many(sentences, pause=SENTENCE_PAUSE, wait=True, on_done=None):
+    """Speaks several sentences as one continuous stream. A wake word heard
+    meanwhile stops it after the audio already queued."""
+    global barge_in
+
+    job = current_job()
+    if not claim_voice(job):
+        return
+
+    sentences = [s for s in sentences if s]
+    for sentence in sentences:
+        print("🗣️", sentence)
+
+    trace = tts_sink.trace = tracer.bound()
+    if trace:
+        tracer.mark("tts_request", trace)
+    set_speaking(True)
+    if asr:
+        asr.flush()
+    speech_cancel.clear()
+    barge_in = True
+
+    def stopped():
+        return speech_cancel.is_set() or (job is not None and job.cancelled.is_set())
+
+    silence = bytes(int(pause * TTS_SAMPLE_RATE) * 2)
+
+    def stream():
+        global barge_in, last_spoken_text
+
+        for sentence in sentences:
+            # Stay only a little ahead of playback so cancelling is quick
+            while tts_sink.remaining() > SPEAK_LOOKAHEAD and not stopped():
+                time.sleep(0.05)
+
+            if stopped():
+                print("🛑 Speech interrupted")
+                tts_sink.clear()
+                break
+
+            last_spoken_text = sentence.lower()
+            pcm = phrase_cache.get(sentence) if phrase_cache else None
+
+            if pcm is not None:
+                tts_sink.write(pcm)
+            else:
+                sent_at = time.monotonic()
+                send_to_piper(sentence)
+                wait_for_piper_output(sent_at)
+
+            if silence:
+                tts_sink.write(silence)
 
-    with q.mutex:
-        q.queue.clear()
+        while tts_sink.remaining() > 0 and not stopped():
+            time.sleep(0.05)
 
-    piper_process.stdin.write((text + "\n").encode("utf-8"))
-    piper_process.stdin.flush()
+        if stopped():
+            # Cut short after the last sentence was queued: drop its tail too
+            tts_sink.clear()
 
-    time.sleep(0.2)
+        if trace:
+            tracer.mark("tts_end", trace)
+        time.sleep(tts_sink.remaining() + ECHO_TAIL)
+        barge_in = False
+        set_speaking(False)
+        voice_lock.release()
 
-    last_response_time = time.time()
-    time.sleep(COOLDOWN_TIME)
-    is_speaking = False
+        if on_done:
+            on_done()
+
+    if wait:
+        stream()
+    else:
+        threading.Thread(target=stream, daemon=True).start()
+
+def cancel_speech():
+    speech_cancel.set()
 
 def clean_speech_text(text):
 
@@ -205,144 +738,119 @@ def preprocess_text(text):
 
 # SONG SYSTEM
 
-def play_random_song():
-    global song_process, is_song_playing, song_list, current_song_index, is_song_paused
+def load_song(track):
+    return load_track(library.path(track), AUDIO_CACHE_DIR)
+
+def song_started(track):
+    print(f"🎵 Playing: {track['title']}")
+
+def playlist_ended():
+    print("🎵 Playlist finished")
 
+def play_random_song(text=""):
+    """Plays the songs matching a name in text, e.g. "अरिजीत का गाना
+    चलाओ", or a random one if no name is given or none of the words
+    matches a song."""
     if not os.path.exists(SONG_FOLDER):
         speak("सॉन्ग फोल्डर नहीं मिला")
         return
 
-    song_list = [f for f in os.listdir(SONG_FOLDER)
-                if f.endswith((".mp3", ".wav"))]
-
-    if not song_list:
-        speak("कोई गाना नहीं मिला")
+    if not library.ready.wait(LIBRARY_WAIT):
+        speak("गानों की सूची अभी बन रही है")
         return
 
-    current_song_index = random.randint(0, len(song_list) - 1)
-    song_path = os.path.join(SONG_FOLDER, song_list[current_song_index])
+    query = [w for w in text.split() if w not in SONG_QUERY_STOPWORDS]
 
-    if song_process:
-        try:
-            song_process.terminate()
-        except:
-            pass
+    # Leftover words ("कोई मस्त सा गाना") are not always a name
+    tracks = library.search(query) if query else []
 
-    is_song_playing = True
-    is_song_paused = False
+    if tracks:
+        index = 0
+    else:
+        tracks = library.all_tracks()
+        if not tracks:
+            speak("कोई गाना नहीं मिला")
+            return
+        index = random.randint(0, len(tracks) - 1)
 
-    print(f"🎵 Playing: {song_list[current_song_index]}")
+    # Spoken first; the mixer ducks the song under it anyway
     speak("गाना चला रहा हूँ")
 
-    song_process = subprocess.Popen(
-        ["aplay", "-D", "plug:dmix", song_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-)
+    if not playlist.play(tracks, index):
+        speak("यह गाना नहीं चल सका")
 
 def stop_song():
-    global song_process, is_song_playing, is_song_paused
-
-    if song_process:
-        try:
-            song_process.terminate()
-        except:
-            pass
-        song_process = None
-        is_song_playing = False
-        is_song_paused = False
+    if playlist.playing():
+        playlist.stop()
         speak("गाना बंद कर दिया")
     else:
         speak("कोई गाना चालू नहीं है")
 
 def pause_song():
-    global song_process, is_song_paused
-    if song_process and not is_song_paused:
-        song_process.send_signal(signal.SIGSTOP)
-        is_song_paused = True
+    if playlist.playing() and not playlist.source.paused:
+        playlist.source.paused = True
         speak("गाना रोक दिया")
 
 def resume_song():
-    global song_process, is_song_paused
-    if song_process and is_song_paused:
-        song_process.send_signal(signal.SIGCONT)
-        is_song_paused = False
+    if playlist.playing() and playlist.source.paused:
+        playlist.source.paused = False
         speak("गाना फिर से चालू किया")
 
-def play_next_song():
-    global current_song_index, song_process, song_list
-
-    if not song_list:
-        speak("कोई गाना नहीं मिला")
+def seek_song(seconds):
+    """Moves the current song by seconds (negative = back)."""
+    source = playlist.current_source
+    if not source:
+        speak("कोई गाना चालू नहीं है")
         return
 
-    # Move to next song
-    current_song_index = (current_song_index + 1) % len(song_list)
+    source.seek(source.tell() + seconds)
+    print(f"⏩ Song at {source.tell():.1f}s")
 
-    song_path = os.path.join(SONG_FOLDER, song_list[current_song_index])
-    print(f"🎵 Playing next: {song_list[current_song_index]}")
-
-    # Stop current song if running
-    if song_process:
-        try:
-            song_process.terminate()
-        except:
-            pass
+def play_next_song():
+    if not playlist.tracks:
+        speak("कोई गाना नहीं मिला")
+        return
 
-    # Start next song
-    song_process = subprocess.Popen(
-        ["aplay", "-D", "plug:dmix", song_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
+    if not playlist.next():
+        speak("यह आखिरी गाना था")
 
 def play_previous_song():
-    global current_song_index, song_process, song_list
-
-    if not song_list:
+    if not playlist.tracks:
         speak("कोई गाना नहीं मिला")
         return
 
-    # Move to previous song
-    current_song_index = (current_song_index - 1) % len(song_list)
+    playlist.previous()
 
-    song_path = os.path.join(SONG_FOLDER, song_list[current_song_index])
-    print(f"🎵 Playing previous: {song_list[current_song_index]}")
+def set_shuffle(text):
+    on = not any(word in text for word in ["बंद", "ऑफ", "off"])
+    playlist.set_shuffle(on)
+    speak("गाने मिला कर चलेंगे" if on else "गाने क्रम से चलेंगे")
 
-    # Stop current song if running
-    if song_process:
-        try:
-            song_process.terminate()
-        except:
-            pass
+def set_repeat(text):
+    if any(word in text for word in ["बंद", "ऑफ", "off"]):
+        mode = "off"
+        speak("रिपीट बंद कर दिया")
+    elif any(word in text for word in ["सब", "सारे", "सभी", "all"]):
+        mode = "all"
+        speak("सारे गाने दोहराए जाएंगे")
+    else:
+        mode = "one"
+        speak("यह गाना दोहराया जाएगा")
+
+    playlist.set_repeat(mode)
 
-    # Start previous song
-    song_process = subprocess.Popen(
-        ["aplay", "-D", "plug:dmix", song_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
 # NUMBER EXTRACTION (HINDI + DIGIT)
 
 def extract_number_from_text(text):
-    # First try digit
-    digit_match = re.search(r'\d+', text)
+    digit_match = re.search(r'\d+', normalize_numbers(text))
     if digit_match:
         return int(digit_match.group())
 
-    # Then try Hindi word
-    words = text.split()
-    for word in words:
-        if word in REVERSE_HINDI:
-            return int(REVERSE_HINDI[word])
-
     return None
 
 # MULTIPLICATION TABLE
 
 def tell_table(text):
-    global REVERSE_HINDI, HINDI_NUMS
-
     if not any(word in text for word in ["टेबल", "पढ़ा", "पाड़ा", "पारा"]):
         return False
 
@@ -352,115 +860,125 @@ def tell_table(text):
 
     number_word = match.group(1).strip()
 
-    if number_word in REVERSE_HINDI:
-        number = int(REVERSE_HINDI[number_word])
-    elif number_word.isdigit():
-        number = int(number_word)
-    else:
+    number = words_to_number(number_word)
+    if number is None:
         return False
+    number = int(number)
 
-    if number > 20:
-        speak("मैं अभी बीस तक का टेबल बता सकता हूँ")
-        return True
-
-    number_word_spoken = HINDI_NUMS.get(str(number), str(number))
+    number_word_spoken = number_to_words(number)
 
-    speak(f"{number_word_spoken} का टेबल सुनिए")
+    sentences = [f"{number_word_spoken} का टेबल सुनिए"]
 
     for i in range(1, 11):
         result = number * i
 
-        i_word = HINDI_NUMS.get(str(i), str(i))
-        result_word = HINDI_NUMS.get(str(result), str(result))
+        i_word = number_to_words(i)
+        result_word = number_to_words(result)
 
-        speak(f"{number_word_spoken} गुणा {i_word} बराबर {result_word}")
+        sentences.append(f"{number_word_spoken} गुणा {i_word} बराबर {result_word}")
+
+    speak_many(sentences)
 
     return True
 
+# SCHEDULED JOBS
+
+def make_job_callback(kind, data):
+    """Rebuilds what a job does from its saved data, also after a restart."""
+    if kind == "alarm":
+        return ring_alarm
+    return lambda: speak(data["message"])
+
+def restore_schedule():
+    missed = scheduler.restore(make_job_callback)
+    print(f"⏰ Restored {len(scheduler.jobs())} scheduled jobs")
+
+    reported = 0
+
+    for record, late in missed:
+        policy = MISSED_JOB_POLICY.get(record["kind"], "report")
+
+        if late < MISSED_JOB_GRACE or policy == "fire":
+            make_job_callback(record["kind"], record["data"])()
+        elif policy == "report":
+            print(f"⏰ Missed {record['kind']} '{record['name']}' by {int(late)} s")
+            reported += 1
+
+    if reported:
+        speak(f"बंद रहने के दौरान {reported} अलार्म, टाइमर या रिमाइंडर छूट गए")
+
 # TIMER
 
 def start_timer(minutes):
-    global timer_active, timer_thread
+    speak(f"{minutes} मिनट का टाइमर शुरू किया")
 
-    if timer_active:
-        speak("टाइमर पहले से चल रहा है")
-        return
+    data = {"message": f"{minutes} मिनट का टाइमर पूरा हो गया"}
+    scheduler.schedule_in(minutes * 60, make_job_callback("timer", data),
+                          name=f"{minutes} मिनट का टाइमर", kind="timer", data=data)
 
-    timer_active = True
-    speak(f"{minutes} मिनट का टाइमर शुरू किया")
 
-    def timer_worker():
-        global timer_active
-        time.sleep(minutes * 60)
-        if timer_active:
-            speak("टाइमर पूरा हो गया")
-            timer_active = False
+def stop_timer():
+    if scheduler.cancel_kind("timer"):
+        speak("टाइमर बंद कर दिया")
+    else:
+        speak("कोई टाइमर चालू नहीं है")
 
-    timer_thread = threading.Thread(target=timer_worker, daemon=True)
-    timer_thread.start()
+def tell_timer_remaining():
+    timers = scheduler.jobs("timer")
 
+    if not timers:
+        speak("कोई टाइमर चालू नहीं है")
+        return
 
-def stop_timer():
-    global timer_active
-    timer_active = False
-    speak("टाइमर बंद कर दिया")
+    remaining = int(timers[0].remaining())
+    minutes, seconds = divmod(remaining, 60)
+    speak(f"टाइमर में {minutes} मिनट {seconds} सेकंड बाकी हैं")
 
 # REMINDER
 
 def start_reminder(minutes, task):
-    global reminder_active, reminder_thread
-
-    reminder_active = True
     speak(f"{minutes} मिनट बाद आपको {task} याद दिलाऊंगा")
 
-    def reminder_worker():
-        global reminder_active
-        time.sleep(minutes * 60)
-        if reminder_active:
-            speak(f"{task} करने का समय हो गया है")
-            reminder_active = False
-
-    reminder_thread = threading.Thread(target=reminder_worker, daemon=True)
-    reminder_thread.start()
+    data = {"message": f"{task} करने का समय हो गया है"}
+    scheduler.schedule_in(minutes * 60, make_job_callback("reminder", data),
+                          name=task, kind="reminder", data=data)
 
 # FIXED TIME REMINDER
 
-def start_fixed_time_reminder(hour, minute, task):
-    def reminder_worker():
-        now = datetime.datetime.now()
-
-        reminder_time = now.replace(hour=hour, minute=minute,
-                                    second=0, microsecond=0)
-
-        if reminder_time <= now:
-            reminder_time += datetime.timedelta(days=1)
+def next_occurrence(hour, minute):
+    now = datetime.datetime.now()
 
-        wait_seconds = (reminder_time - now).total_seconds()
+    when = now.replace(hour=hour % 24, minute=minute,
+                       second=0, microsecond=0)
 
-        time.sleep(wait_seconds)
+    if when <= now:
+        when += datetime.timedelta(days=1)
 
-        speak(f"याद दिला रहा हूँ, {task}")
+    return when
 
-    threading.Thread(target=reminder_worker, daemon=True).start()
+def start_fixed_time_reminder(hour, minute, task):
+    data = {"message": f"याद दिला रहा हूँ, {task}"}
+    scheduler.schedule_at(next_occurrence(hour, minute),
+                          make_job_callback("reminder", data),
+                          name=task, kind="reminder", data=data)
 
 
 def stop_reminder():
-    global reminder_active
-    reminder_active = False
+    scheduler.cancel_kind("reminder")
     speak("रिमाइंडर बंद कर दिया")
 
 def cancel_reminder():
-    global reminder_active
-    reminder_active = False
-    speak("रिमाइंडर रद्द कर दिया गया है")
+    if scheduler.cancel_kind("reminder"):
+        speak("रिमाइंडर रद्द कर दिया गया है")
+    else:
+        speak("कोई रिमाइंडर सेट नहीं है")
 
 def extract_hour_minute(text):
     hour = None
     minute = 0
 
     # Convert Hindi numbers → digits first
-    for word, num in REVERSE_HINDI.items():
-        text = text.replace(word, num)
+    text = normalize_numbers(text)
 
     match = re.search(r'(\d+)\s*बज[ेकर]*\s*(\d+)?', text)
 
@@ -468,76 +986,69 @@ def extract_hour_minute(text):
         hour = int(match.group(1))
         if match.group(2):
             minute = int(match.group(2))
+        return hour, minute
 
-    return hour, minute
-
-# ALARM SYSTEM
-
-def start_alarm(hour, minute):
-    global alarm_thread, alarm_active
-
-    if alarm_active:
-        speak("अलार्म पहले से सेट है")
-        return
-
-    alarm_active = True
-    speak(f"{hour} बजकर {minute} मिनट का अलार्म लगा दिया गया है")
+    # Misheard numbers around "बजे" / "बजकर"
+    words = text.split()
+    for i, word in enumerate(words):
+        if not word.startswith("बज") or i == 0:
+            continue
 
-    def alarm_worker():
-        global alarm_active, alarm_process
+        hour_match = fuzzy_number(words[i - 1], "hour")
+        if hour_match is None:
+            continue
 
-        now = datetime.datetime.now()
+        hour = hour_match[0]
 
-        alarm_time = now.replace(hour=hour, minute=minute,
-                                second=0, microsecond=0)
+        if i + 1 < len(words):
+            minute_match = fuzzy_number(words[i + 1], "minute")
+            if minute_match:
+                minute = minute_match[0]
+        break
 
-        if alarm_time <= now:
-            alarm_time += datetime.timedelta(days=1)
+    return hour, minute
 
-        wait_seconds = (alarm_time - now).total_seconds()
+# ALARM SYSTEM
 
-        time.sleep(wait_seconds)
+def ring_alarm():
+    global alarm_source
 
-        if alarm_active:
-            speak("अलार्म बज रहा है")
+    speak("अलार्म बज रहा है")
 
-            alarm_path = os.path.join(CURRENT_DIR, "alarm.wav")
+    alarm_path = os.path.join(CURRENT_DIR, "alarm.mp3")
 
-            alarm_process = subprocess.Popen(
-                ["mpg123", alarm_path],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
+    try:
+        alarm_source = mixer.add(load_track(alarm_path, AUDIO_CACHE_DIR, bus="alarm"))
+    except Exception as e:
+        print("⚠ Alarm sound could not be played:", e)
 
-            # ✅ Reset alarm state so new alarm can be set
-            alarm_active = False
+def start_alarm(hour, minute):
+    name = f"{hour % 24}:{minute:02d}"
 
-            alarm_path = os.path.join(CURRENT_DIR, "alarm.mp3")
+    if any(job.name == name for job in scheduler.jobs("alarm")):
+        speak("अलार्म पहले से सेट है")
+        return
 
-            alarm_process = subprocess.Popen(
-                ["mpg123", alarm_path],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
+    scheduler.schedule_at(next_occurrence(hour, minute), ring_alarm,
+                          name=name, kind="alarm", data={})
 
-    alarm_thread = threading.Thread(target=alarm_worker, daemon=True)
-    alarm_thread.start()
+    speak(f"{hour} बजकर {minute} मिनट का अलार्म लगा दिया गया है")
 
 
 def stop_alarm():
-    global alarm_active, alarm_process
+    global alarm_source
 
-    if not alarm_active:
+    ringing = alarm_source is not None and mixer.playing(alarm_source)
+
+    if not ringing and not scheduler.jobs("alarm"):
         speak("कोई अलार्म चालू नहीं है")
         return
 
-    alarm_active = False
-
-    if alarm_process:
-        try:
-            alarm_process.terminate()
-        except:
-            pass
+    if ringing:
+        mixer.remove(alarm_source)
+        alarm_source = None
+    else:
+        scheduler.cancel_kind("alarm")
 
     speak("अलार्म बंद कर दिया गया है")
 
@@ -578,7 +1089,7 @@ def normalize_hindi_number(word):
 def tell_day_of_date(text):
     today = datetime.date.today()
     year = today.year
-    words = text.split()
+    words = normalize_numbers(text).split()
 
     # Step 1: Find month
     month = None
@@ -600,30 +1111,23 @@ def tell_day_of_date(text):
     except:
         return False
 
+    if month_index == 0:
+        return False
+
     # Normalize word
     day_word = normalize_hindi_number(day_word)
 
-    day = None
-
-    # 1️ Direct match
-    if day_word in REVERSE_HINDI:
-        day = int(REVERSE_HINDI[day_word])
-
-    # 2️ Digit
-    elif day_word.isdigit():
-        day = int(day_word)
-
-    # 3️ Fuzzy match by first 3 letters
-    else:
-        for hindi_word, number in REVERSE_HINDI.items():
-            if day_word[:3] == hindi_word[:3]:
-                day = int(number)
-                break
+    # Direct match (word or digit), else closest day word
+    day_match = fuzzy_number(day_word, "day")
 
-    if day is None:
+    if day_match is None:
         return False
 
-    # Step 3: Extract year (look for 4 digit number first)
+    day, distance = day_match
+    if distance:
+        print(f"🔎 '{day_word}' → {day} (distance {distance})")
+
+    # Step 3: Extract year ("दो हजार चौबीस" is already 2024 here)
     for w in words:
         if w.isdigit() and len(w) == 4:
             year = int(w)
@@ -711,42 +1215,11 @@ def tell_date_of_relative_day(text):
 
 # CALCULATOR
 
-def extract_all_numbers(text):
-    words = text.split()
-    numbers = []
-    current_value = 0
-
-    for word in words:
-        # Digit
-        if word.isdigit():
-            numbers.append(int(word))
-            continue
-
-        # Hindi number word
-        if word in REVERSE_HINDI:
-            value = int(REVERSE_HINDI[word])
-
-            if value == 100:
-                current_value *= 100
-            elif value == 1000:
-                current_value *= 1000
-            else:
-                current_value += value
-        else:
-            if current_value != 0:
-                numbers.append(current_value)
-                current_value = 0
-
-    if current_value != 0:
-        numbers.append(current_value)
-
-    return numbers
-
 def tell_calculation(text):
 
     words = text.split()
 
-    numbers = extract_all_numbers(text)
+    numbers = extract_numbers(text)
 
     if len(numbers) < 2:
         return False
@@ -777,10 +1250,11 @@ def tell_calculation(text):
     if result is None:
         return False
 
-    # Convert result to Hindi 
-    result_str = str(int(result)) if result == int(result) else str(result)
+    # Convert result to Hindi, at any size
+    if result == int(result):
+        result = int(result)
 
-    result_word = HINDI_NUMS.get(result_str, result_str)
+    result_word = number_to_words(result)
 
     speak(f"उत्तर {result_word} है")
 
@@ -794,206 +1268,394 @@ def get_usb_mic_index():
             return i
     return None
 
+LIGHT_WORDS = ["लाइट", "बत्ती", "तुबेलाइट"]
 
-def process_command(text):
-    
-    # ALARM OFF
-
-    if any(k in text for k in ALARM_KEYWORDS) and \
-    any(x in text for x in ["बंद", "ऑफ", "रोक"]):
-        stop_alarm()
-        return
+@router.intent("alarm_off", ALARM_KEYWORDS, ["बंद", "ऑफ", "रोक"],
+               priority=230, policy="preempt")
+def alarm_off_intent(text):
+    stop_alarm()
 
+@router.intent("alarm_set", ALARM_KEYWORDS, ["बजे", "बजकर"], priority=220)
+def alarm_set_intent(text):
+    hour, minute = extract_hour_minute(text)
 
-    # ALARM SET
+    if hour is not None:
+        start_alarm(hour, minute)
+    else:
+        speak("कितने बजे का अलार्म लगाना है?")
 
-    if any(k in text for k in ALARM_KEYWORDS) and \
-        ("बजे" in text or "बजकर" in text):
+@router.intent("reminder_cancel", ["रिमाइंडर बंद", "याद बंद"],
+               priority=210, policy="preempt")
+def reminder_cancel_intent(text):
+    cancel_reminder()
 
-        hour, minute = extract_hour_minute(text)
+@router.intent("reminder_fixed", ["बजे", "बजकर"], ["याद", "रिमाइंडर"], priority=200)
+def reminder_fixed_intent(text):
+    hour, minute = extract_hour_minute(text)
 
-        if hour is not None:
-            start_alarm(hour, minute)
-        else:
-            speak("कितने बजे का अलार्म लगाना है?")
+    if hour is None:
+        return False
 
-        return
+    cleaned_text = re.sub(r'\d+\s*बज[ेकर]*\s*\d*', '', normalize_numbers(text))
+    cleaned_text = cleaned_text.replace("मुझे", "")
+    cleaned_text = cleaned_text.replace("याद दिलाना", "")
+    cleaned_text = cleaned_text.replace("रिमाइंडर", "")
+    cleaned_text = cleaned_text.replace("पर", "")
+    cleaned_text = cleaned_text.strip()
+
+    task = cleaned_text if cleaned_text else "आपका काम"
+
+    start_fixed_time_reminder(hour, minute, task)
+    speak(f"{hour} बजकर {minute} मिनट पर याद दिला दूँगा")
+
+@router.intent("timer_stop", ["टाइमर"], ["बंद", "रद्द", "कैंसल"],
+               priority=195, policy="preempt")
+def timer_stop_intent(text):
+    stop_timer()
+
+@router.intent("timer_remaining", ["टाइमर"], ["बाकी", "कितना", "कितने"],
+               priority=192, policy="parallel")
+def timer_remaining_intent(text):
+    tell_timer_remaining()
+
+@router.intent("timer", ["टाइमर"], priority=190)
+def timer_intent(text):
+    minutes = extract_number_from_text(text)
+    if minutes:
+        start_timer(minutes)
+    else:
+        speak("कितने मिनट का टाइमर लगाना है?")
 
-    #  CANCEL REMINDER 
+@router.intent("reminder_relative", ["याद", "रिमाइंडर"], priority=180)
+def reminder_relative_intent(text):
+    minutes = extract_number_from_text(text)
 
-    if "रिमाइंडर बंद" in text or "याद बंद" in text:
-        cancel_reminder()
-        return
+    if minutes:
+        task = ""
 
-    #  FIXED TIME REMINDER 
+        if "बाद" in text:
+            task = text.split("बाद")[-1]
 
-    if ("बजे" in text or "बजकर" in text) and ("याद" in text or "रिमाइंडर" in text):
+        task = task.replace("याद दिलाना", "")
+        task = task.replace("मुझे", "")
+        task = task.strip()
 
-        hour, minute = extract_hour_minute(text)
+        if not task:
+            task = "आपका काम"
 
-        if hour is not None:
+        start_reminder(minutes, task)
+    else:
+        speak("कितने मिनट बाद याद दिलाना है?")
+
+@router.intent("light_on", ["चालू"], LIGHT_WORDS, priority=170, policy="parallel")
+def light_on_intent(text):
+    light_led.on()
+    speak("लाइट चालू कर दी")
+
+@router.intent("light_off", ["बंद"], LIGHT_WORDS, priority=160, policy="parallel")
+def light_off_intent(text):
+    light_led.off()
+    speak("लाइट बंद कर दी")
+
+SONG_WORDS = ["गाना", "गाने", "गीत", "सॉन्ग"]
+
+@router.intent("song_shuffle", ["शफल", "shuffle", "मिला कर", "मिलाकर"],
+               SONG_WORDS + ["शफल", "shuffle"], priority=156)
+def song_shuffle_intent(text):
+    set_shuffle(text)
+
+@router.intent("song_repeat", ["रिपीट", "repeat", "दोहरा"],
+               SONG_WORDS + ["रिपीट", "repeat"], priority=155)
+def song_repeat_intent(text):
+    set_repeat(text)
+
+@router.intent("song_stop", ["बंद करो"], priority=150, policy="preempt")
+def song_stop_intent(text):
+    if playlist.playing():
+        stop_song()
+    else:
+        speak("कुछ भी चालू नहीं है")
 
-            cleaned_text = re.sub(r'\d+\s*बज[ेकर]*\s*\d*', '', text)
-            cleaned_text = cleaned_text.replace("मुझे", "")
-            cleaned_text = cleaned_text.replace("याद दिलाना", "")
-            cleaned_text = cleaned_text.replace("रिमाइंडर", "")
-            cleaned_text = cleaned_text.replace("पर", "")
-            cleaned_text = cleaned_text.strip()
+@router.intent("song_seek", ["आगे", "पीछे"], ["सेकंड", "सेकेंड", "मिनट"], priority=145)
+def song_seek_intent(text):
+    if not playlist.current_source:
+        return False
 
-            task = cleaned_text if cleaned_text else "आपका काम"
+    numbers = extract_numbers(text)
+    amount = numbers[0] if numbers else 10
+    if "मिनट" in text:
+        amount *= 60
+
+    seek_song(-amount if "पीछे" in text else amount)
+
+@router.intent("song_next", ["अगला", "next"], priority=140)
+def song_next_intent(text):
+    play_next_song()
+
+@router.intent("song_previous", ["पिछला", "previous"], priority=130)
+def song_previous_intent(text):
+    play_previous_song()
+
+@router.intent("song_pause", ["रोक", "pause"], priority=120, policy="preempt")
+def song_pause_intent(text):
+    pause_song()
+
+@router.intent("song_resume", ["फिर से", "resume"], priority=110)
+def song_resume_intent(text):
+    resume_song()
+
+@router.intent("song_play", ["गाना", "गीत", "संगीत", "सॉन्ग"], priority=100)
+def song_play_intent(text):
+    play_random_song(text)
+
+@router.intent("calculator", ["जोड़", "प्लस", "और", "घटा", "माइनस",
+                              "गुणा", "इंटू", "गुना", "भाग", "डिवाइड"],
+               priority=90, policy="parallel")
+def calculator_intent(text):
+    return tell_calculation(text)
+
+@router.intent("table", ["टेबल", "पढ़ा", "पाड़ा", "पारा"], priority=80)
+def table_intent(text):
+    return tell_table(text)
+
+@router.intent("relative_week_date",
+               words("अगला", "अगले", "अगली", "पिछला", "पिछले", "पिछली", "इस"),
+               list(HINDI_DAY_TO_INDEX), priority=70, policy="parallel")
+def relative_week_date_intent(text):
+    return tell_date_of_relative_day(text)
+
+@router.intent("date_day", ["को"], ["कौनसा", "कौन सा", "वार", "दिन"],
+               priority=60, policy="parallel")
+def date_day_intent(text):
+    return tell_day_of_date(text)
+
+@router.intent("time", ["कितने बज", "टाइम", "समय"], priority=50, policy="parallel")
+def time_intent(text):
+    tell_time()
+
+@router.intent("date", ["तारीख", "डेट"], priority=40, policy="parallel")
+def date_intent(text):
+    tell_date()
+
+@router.intent("day", ["दिन", "वार", "डे"], priority=30, policy="parallel")
+def day_intent(text):
+    tell_day()
+
+@router.intent("prime_minister", ["प्राइम मिनिस्टर", "प्रधानमंत्री", "पि एम"],
+               priority=20, policy="parallel")
+def prime_minister_intent(text):
+    speak("भारत के प्रधानमंत्री नरेंद्र मोदी हैं")
+
+@router.intent("capital", ["भारत", "इंडिया", "हिन्दुस्थान"], ["कैपिटल", "राजधानी"],
+               priority=10, policy="parallel")
+def capital_intent(text):
+    speak("भारत की राजधानी नई दिल्ली है")
+
+@router.fallback
+def fallback_intent(text):
+    speak("क्षमा करें, मैं इसमें आपकी सहायता नहीं कर सकता")
 
-            start_fixed_time_reminder(hour, minute, task)
-            speak(f"{hour} बजकर {minute} मिनट पर याद दिला दूँगा")
-            return
+router.compile()
 
-    #  TIMER
+def process_command(text):
+    """Routes the command and hands it to the handler pool, under the
+    policy of the intent it matched, along with the utterance's trace.
+    Returns at once."""
+    submit_command(text, router.match(text), tracer.listening)
+
+def submit_command(text, matches, trace):
+    if matches:
+        handlers.submit(run_command, text, matches, trace, policy=matches[0].policy,
+                        name=matches[0].name)
+    else:
+        handlers.submit(run_command, text, matches, trace, name="fallback")
 
-    if "टाइमर" in text:
-        minutes = extract_number_from_text(text)
-        if minutes:
-            start_timer(minutes)
-        else:
-            speak("कितने मिनट का टाइमर लगाना है?")
-        return
+def run_command(text, matches, trace):
+    redirected = []
 
-    #  RELATIVE REMINDER (After X Minutes)
+    def redirect(text, rest):
+        # Passed on to an intent with another policy: queued again under it
+        redirected.append(True)
+        submit_command(text, rest, trace)
 
-    if "याद" in text or "रिमाइंडर" in text:
+    tracer.bind(trace)
+    try:
+        intent = router.dispatch(text, matches, redirect=redirect)
+        if not redirected:
+            tracer.mark("handler_done", intent=intent)
+    finally:
+        tracer.bind(None)
 
-        minutes = extract_number_from_text(text)
+router.on_match = lambda intent: tracer.mark("intent")
 
-        if minutes:
-            task = ""
+# RECOGNITION
 
-            if "बाद" in text:
-                task = text.split("बाद")[-1]
+asr = None
+asr_service = None
+asr_events = queue.Queue()      # worker events, handled by the main loop
 
-            task = task.replace("याद दिलाना", "")
-            task = task.replace("मुझे", "")
-            task = task.strip()
+def load_asr():
+    global asr, asr_service
 
-            if not task:
-                task = "आपका काम"
+    if not os.path.exists(VOSK_MODEL_PATH):
+        raise FileNotFoundError("Model missing")
 
-            start_reminder(minutes, task)
-        else:
-            speak("कितने मिनट बाद याद दिलाना है?")
+    asr = AsrProcess(VOSK_MODEL_PATH, cpu=ASR_CPU, partials=STREAMING_INTENTS,
+                     on_event=asr_events.put, on_exit=supervisor.check_now)
+    asr.start()
+    asr.wait_ready(ASR_READY_TIMEOUT)
 
-        return
+    # Restarted like piper if it dies; the model is loaded again in the
+    # new worker while capture carries on into the ring
+    asr_service = supervisor.add_running("asr", asr.start, asr.stop, asr.alive)
 
-    #  LIGHT CONTROL
+early_command = None
 
-    if any(x in text for x in ["चालू"]) and any(x in text for x in ["लाइट", "बत्ती", "तुबेलाइट"]):
-        light_led.on()
-        speak("लाइट चालू कर दी")
-        return
+def extract_command(text):
+    words = text.split()
 
-    if any(x in text for x in ["बंद"]) and any(x in text for x in ["लाइट", "बत्ती", "तुबेलाइट"]):
-        light_led.off()
-        speak("लाइट बंद कर दी")
-        return
+    # The replayed pre-roll may hold speech from before "वीर"
+    wake_index = next((i for i, w in enumerate(words)
+                       if w in WAKE_WORDS), None)
 
-    #  SONG CONTROLS
+    if wake_index is None:
+        return None
 
-    if "बंद करो" in text:
-        if is_song_playing:
-            stop_song()
-        else:
-            speak("कुछ भी चालू नहीं है")
-        return
+    command = " ".join(words[wake_index + 1:])
+    return preprocess_text(command)
 
-    if any(w in text for w in ["अगला", "next"]):
-        play_next_song()
-        return
+def handle_asr_event(event):
+    global early_command
 
-    if any(w in text for w in ["पिछला", "previous"]):
-        play_previous_song()
-        return
+    kind = event[0]
 
-    if any(x in text for x in ["रोक", "pause"]):
-        pause_song()
-        return
+    if kind == "onset":
+        tracer.begin()
 
-    if any(x in text for x in ["फिर से", "resume"]):
-        resume_song()
-        return
+    elif kind == "wake":
+        print("👂 Wake word detected")
+        tracer.mark("wake")
+        early_command = None
+        if is_speaking:
+            # Barge-in: stop the answer and whichever handler is giving it
+            cancel_speech()
+            handlers.cancel_all()
 
-    if any(w in text for w in ["गाना", "गीत", "संगीत", "सॉन्ग"]):
-        play_random_song()
-        return
+    elif kind == "partial":
+        command = extract_command(event[1])
+        if early_command is None and command in EARLY_COMMANDS:
+            early_command = command
+            print("⚡ Early command:", early_command)
+            handle_transcript(event[1], final=False)
 
-    # CALCULATOR
+            # Done with this session: what is said after the answer must
+            # not run on into it
+            if asr:
+                asr.reset()
 
-    if tell_calculation(text):
-        return
+    elif kind == "final":
+        handle_transcript(event[1])
 
-    #  MULTIPLICATION TABLE
+    elif kind == "timeout":
+        print("⌛ No command heard")
 
-    if tell_table(text):
-        return
+    elif kind == "speech_end":
+        tracer.mark("speech_end")
 
-    #  RELATIVE WEEK DATE LOOKUP
-    words = text.split()
+    elif kind == "utterance_end":
+        tracer.end_utterance()
 
-    if (any(w in words for w in ["अगला", "अगले", "अगली",
-                                "पिछला", "पिछले", "पिछली",
-                                "इस"])) and \
-    any(day in text for day in HINDI_DAY_TO_INDEX):
+def handle_transcript(text, final=True):
+    global early_command
 
-        if tell_date_of_relative_day(text):
-            return
+    print("🎙 Heard:", text)
+    tracer.mark("asr_final", transcript=text)
 
-    #  SPECIFIC DATE DAY LOOKUP
+    command = extract_command(text)
 
-    if ("को" in text) and any(x in text for x in ["कौनसा", "कौन सा", "वार", "दिन"]):
-        if tell_day_of_date(text):
+    # The final result of a command already run from its partial
+    if early_command is not None and final:
+        handled, early_command = early_command, None
+        # Word by word: "टाइमर बंद करो" is not a longer "टाइम"
+        handled_words = handled.split()
+        if command is not None and command.split()[:len(handled_words)] == handled_words:
+            print("Already handled early")
             return
 
-    #  CURRENT TIME
-    
-    if any(x in text for x in ["कितने बज", "टाइम", "समय"]):
-        tell_time()
+    if is_speaking:
         return
 
-    #  CURRENT DATE
-    if any(x in text for x in ["तारीख", "डेट"]):
-        tell_date()
+    if time.time() - last_response_time < ECHO_TAIL:
         return
 
-    #  CURRENT DAY
-    if any(x in text for x in ["दिन", "वार", "डे"]):
-        tell_day()
+    if last_spoken_text and last_spoken_text in text:
+        print("Ignored self echo")
         return
 
-    #  PM OF INDIA
-    if any(x in text for x in ["प्राइम मिनिस्टर", "प्रधानमंत्री", "पि एम"]):
-        speak("भारत के प्रधानमंत्री नरेंद्र मोदी हैं")
+    if command is None:
+        print("Wake word missing")
         return
 
-    #  CAPITAL OF INDIA
-    
-    if any(x in text for x in ["भारत", "इंडिया", "हिन्दुस्थान"]) and \
-    any(x in text for x in ["कैपिटल", "राजधानी"]):
+    process_command(command)
 
-        speak("भारत की राजधानी नई दिल्ली है")
-        return
+class Decimator:
+    """Low-pass filters and resamples int16 mono blocks down to SAMPLE_RATE."""
 
-    # ❌ FALLBACK
+    TAPS = 31
 
-    speak("क्षमा करें, मैं इसमें आपकी सहायता नहीं कर सकता")
-    
-# VOSK
+    def __init__(self, in_rate, out_rate, max_block):
+        self.step = in_rate / out_rate
+
+        # Windowed-sinc low-pass just below the output Nyquist frequency
+        cutoff = 0.45 * out_rate / in_rate
+        n = np.arange(self.TAPS) - (self.TAPS - 1) / 2
+        taps = np.sinc(2 * cutoff * n) * np.hamming(self.TAPS)
+        self.taps = (taps / taps.sum()).astype(np.float32)
+
+        self.work = np.zeros(self.TAPS - 1 + max_block, dtype=np.float32)
+        self.filtered = np.zeros(max_block + 1, dtype=np.float32)
+        self.out = np.empty(int(max_block / self.step) + 2, dtype=np.int16)
+        self.last = 0.0
+        self.phase = 1.0
+
+    def process(self, indata):
+        x = np.frombuffer(indata, dtype=np.int16)
+        n = len(x)
+        history = self.TAPS - 1
+
+        # work = [filter history | new block], filtered = [last output | block]
+        work = self.work[:history + n]
+        work[history:] = x
+        self.filtered[0] = self.last
+        self.filtered[1:n + 1] = np.convolve(work, self.taps, mode="valid")
+        self.work[:history] = work[n:]
+        self.last = self.filtered[n]
+
+        positions = np.arange(self.phase, n, self.step)
+        index = positions.astype(np.int32)
+        frac = (positions - index).astype(np.float32)
+        samples = self.filtered[index] * (1 - frac) + \
+            self.filtered[index + 1] * frac
 
-if not os.path.exists(VOSK_MODEL_PATH):
-    print("Model missing")
-    sys.exit(1)
+        count = len(positions)
+        out = self.out[:count]
+        np.clip(samples, -32768, 32767, out=samples)
+        out[:] = samples
+        self.phase = positions[-1] + self.step - n if count else self.phase - n
 
-model = vosk.Model(VOSK_MODEL_PATH)
-rec = vosk.KaldiRecognizer(model, 44100)
+        return out
+
+decimator = None
 
 def callback(indata, frames, time_info, status):
-    if not is_speaking:
-        q.put(bytes(indata))
+    # During long answers the mic stays open for the wake word only
+    if is_speaking and not barge_in:
+        return
+
+    if decimator:
+        asr.write(decimator.process(indata))
+    else:
+        asr.write(indata)
 
 def get_input_device():
     devices = sd.query_devices()    
@@ -1003,7 +1665,17 @@ def get_input_device():
             return i
     return None
 
+def get_capture_rate(device_index):
+    try:
+        sd.check_input_settings(device=device_index, samplerate=SAMPLE_RATE,
+                                channels=1, dtype='int16')
+        return SAMPLE_RATE
+    except Exception:
+        return int(sd.query_devices(device_index)["default_samplerate"])
+
 def start_audio_stream():
+    global decimator
+
     while True:
         try:
             device_index = get_input_device()
@@ -1015,10 +1687,19 @@ def start_audio_stream():
 
             print(f"🎤 Starting microphone on device {device_index}...")
 
+            capture_rate = get_capture_rate(device_index)
+            blocksize = round(BLOCK_SIZE * capture_rate / SAMPLE_RATE)
+
+            if capture_rate != SAMPLE_RATE:
+                print(f"🎤 Decimating {capture_rate} Hz → {SAMPLE_RATE} Hz")
+                decimator = Decimator(capture_rate, SAMPLE_RATE, blocksize)
+            else:
+                decimator = None
+
             stream = sd.RawInputStream(
                 device=device_index,
-                samplerate=44100,
-                blocksize=4096,
+                samplerate=capture_rate,
+                blocksize=blocksize,
                 dtype='int16',
                 channels=1,
                 callback=callback
@@ -1032,70 +1713,121 @@ def start_audio_stream():
             print(f"⚠ Mic init failed: {e}")
             time.sleep(3)
 
-# MAIN LOOP
+# STARTUP
 
-if __name__ == "__main__":
+class StartupPhases:
+    """Runs init phases on their own threads, each once the phases it
+    depends on are done, and times them."""
 
-    start_tts()
-    print("🟢 VEER AI READY")
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events = {}
+        self.times = {}
+        self.errors = {}
 
-    print("🔊 Stabilizing audio...")
-    time.sleep(5)
+    def run(self, name, fn, after=()):
+        done = threading.Event()
+        self.events[name] = done
 
-    speak("वीर आपकी सहायता के लिए तैयार है")
+        def phase():
+            for dependency in after:
+                self.events[dependency].wait()
 
-    stream = start_audio_stream()
-    print("🎤 Listening...")
+            start = time.monotonic()
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠ Startup phase '{name}' failed:", e)
+                self.errors[name] = e
+            self.times[name] = time.monotonic() - start
+            done.set()
+
+        threading.Thread(target=phase, daemon=True).start()
+
+    def wait(self, *names):
+        for name in names:
+            self.events[name].wait()
+        return not any(name in self.errors for name in names)
+
+    def report(self, label):
+        phases = ", ".join(f"{name} {seconds:.2f}s"
+                           for name, seconds in sorted(self.times.items(),
+                                                       key=lambda p: -p[1]))
+        print(f"⏱ {label} in {time.monotonic() - self.started:.2f}s ({phases})")
+
+def start_audio_output_and_tts():
+    start_mixer()
+    start_tts()
+    supervisor.start()
+    wait_for_audio_output()
+
+# TRACING
+
+def start_tracing():
+    tracer.add_gauge("veer_audio_buffer_overflows",
+                     "Capture blocks dropped because recognition fell behind",
+                     lambda: asr.ring.overflows)
+    tracer.add_gauge("veer_service_restarts",
+                     "Restarts of supervised services",
+                     lambda: sum(s.restarts for s in supervisor.services))
 
     try:
-        while True:
-            data = q.get()
+        tracer.open_log(TRACE_LOG)
+        tracer.serve(TRACE_SOCKET)
+    except OSError as e:
+        print("⚠ Metrics not available:", e)
 
-            if rec.AcceptWaveform(data):
+# MAIN LOOP
 
-                result = json.loads(rec.Result())
-                text = result.get("text", "").strip().lower()
+if __name__ == "__main__":
 
-                if not text:
-                    continue
+    startup = StartupPhases()
+    startup.run("asr", load_asr)
+    startup.run("config", load_config)
+    startup.run("gpio", init_gpio)
+    startup.run("audio", start_audio_output_and_tts)
+    startup.run("piper", probe_piper, after=["audio"])
+    startup.run("library", library.load)
 
-                print("🎙 Heard:", text)
+    start_tracing()
 
-                if is_speaking:
-                    continue
+    if not startup.wait("asr"):
+        print("Model missing")
+        sys.exit(1)
 
-                if time.time() - last_response_time < 0.7:
-                    continue
+    startup.wait("config", "gpio", "audio", "library")
+    library.start()
+    watch_config()
 
-                if last_spoken_text and last_spoken_text in text:
-                    print("Ignored self echo")
-                    continue
+    # The mic opens as soon as the model is loaded. Piper may still be
+    # loading its voice; anything said meanwhile is queued in its stdin.
+    stream = start_audio_stream()
+    startup.report("🟢 VEER AI READY")
 
-                if not text:
-                    continue
+    greeting = "वीर आपकी सहायता के लिए तैयार है"
+    if phrase_cache.get(greeting) is None:
+        startup.wait("piper")
+    speak(greeting)
 
-                print("🎙 Heard:", text)
+    restore_schedule()
 
-                words = text.split()
-                if not words:
-                    continue
+    def report_voice_ready():
+        if startup.wait("piper"):
+            startup.report("🔊 Voice ready")
 
-                if words[0] not in WAKE_WORDS:
-                    print("Wake word missing")
-                    continue
+    threading.Thread(target=report_voice_ready, daemon=True).start()
+    print("🎤 Listening...")
 
-                command = " ".join(words[1:])
-                command = preprocess_text(command)
-                process_command(command)
+    try:
+        while True:
+            handle_asr_event(asr_events.get())
 
     except KeyboardInterrupt:
         print("\n🛑 VEER AI shutting down safely...")
+        print("📊", asr.ring.stats())
+        print("📊", supervisor.stats())
 
-        if song_process:
-            try:
-                song_process.terminate()
-            except:
-                pass
+        scheduler.stop()
 
         try:
             light_led.off()
@@ -1108,11 +1840,11 @@ if __name__ == "__main__":
             except:
                 pass
 
-        if aplay_process:
-            try:
-                aplay_process.terminate()
-            except:
-                pass
+        if mixer:
+            mixer.stop()
+
+        stream.stop()
+        asr.close()
 
         print("✅ Shutdown complete.")
         sys.exit(0)
@@ -0,0 +1,547 @@
+import collections
+import hashlib
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+import sounddevice as sd
+
+# AUDIO MIXER
+#
+# Songs, speech and the alarm all play through one output stream. Each
+# source belongs to a bus ("music", "voice" or "alarm"); while anything is
+# playing on the voice or alarm bus the music bus is ducked, with a short
+# ramp so the change does not click.
+#
+# Songs are memory-mapped rather than loaded, so pause, resume and seek are
+# just a change of the read position. MP3s have no in-process decoder here,
+# so they are decoded by mpg123 into a raw PCM cache: the first play reads
+# the cache file as it is being written, later plays map it. The cache is
+# kept under CACHE_MAX_BYTES, least recently played first.
+
+RATE = 44100
+CHANNELS = 2
+BLOCK_SIZE = 1024
+
+DUCK_GAIN = 0.2               # music level while speaking / ringing
+DUCK_RAMP = 0.25              # seconds to fade between the two levels
+DUCKING_BUSES = ("voice", "alarm")
+
+CACHE_MAX_BYTES = 1024 ** 3   # ~100 minutes of decoded audio
+DECODE_START = 0.5            # seconds decoded before a first play starts
+DECODE_START_TIMEOUT = 10
+STALE_TEMP_AGE = 600          # decodes left behind by a crash
+
+def to_output(block, channels):
+    """(frames, n) float32 -> (frames, channels)."""
+    if block.shape[1] == channels:
+        return block
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    return block[:, :channels]
+
+class PcmSource:
+    """A whole track of int16 frames, usually memory-mapped."""
+
+    def __init__(self, frames, rate, bus="music", gain=1.0, on_end=None):
+        self.frames = frames            # (n, channels) int16
+        self.rate = rate
+        self.bus = bus
+        self.gain = gain
+        self.on_end = on_end
+        self.step = rate / RATE
+        self.position = 0.0             # in source frames
+        self.paused = False
+
+    def active(self):
+        return not self.paused and self.position < len(self.frames)
+
+    def tell(self):
+        return self.position / self.rate
+
+    def seek(self, seconds):
+        self.position = float(min(max(0, int(seconds * self.rate)), len(self.frames)))
+
+    def read(self, count):
+        """Up to count output frames, or None once the track has ended."""
+        if self.paused:
+            return np.zeros((0, CHANNELS), np.float32)
+
+        total = len(self.frames)
+        start = self.position
+
+        if start >= total:
+            return None
+
+        if self.step == 1.0:
+            start = int(start)
+            block = self.frames[start:start + count].astype(np.float32)
+            self.position = start + len(block)
+        else:
+            # Linear interpolation for tracks at another sample rate
+            index = start + np.arange(count) * self.step
+            index = index[index < total - 1]
+            whole = index.astype(np.int64)
+            fraction = (index - whole)[:, None].astype(np.float32)
+            block = self.frames[whole] * (1 - fraction) + self.frames[whole + 1] * fraction
+            self.position = total if len(index) < count else start + count * self.step
+
+        return to_output(block, CHANNELS)
+
+class StreamSource:
+    """Open-ended PCM written as it is produced (piper's speech)."""
+
+    def __init__(self, rate, channels=1, bus="voice", gain=1.0):
+        self.rate = rate
+        self.channels = channels
+        self.bus = bus
+        self.gain = gain
+        self.on_end = None
+        self.step = rate / RATE
+        self.lock = threading.Lock()
+        self.queue = collections.deque()
+        self.partial = b""              # bytes of a frame split across writes
+        self.last = np.zeros((1, channels), np.float32)
+        self.phase = 0.0
+
+    def write(self, data):
+        frame_bytes = 2 * self.channels
+        data = self.partial + bytes(data)
+        usable = len(data) - len(data) % frame_bytes
+        self.partial = data[usable:]
+
+        if not usable:
+            return
+
+        block = np.frombuffer(data[:usable], np.int16).reshape(-1, self.channels)
+        block = block.astype(np.float32)
+
+        if self.step != 1.0:
+            # Resample, carrying the last frame and phase into the next write
+            block = np.concatenate([self.last, block])
+            index = self.phase + np.arange(int((len(block) - 1 - self.phase) / self.step) + 1) * self.step
+            index = index[index < len(block) - 1]
+            whole = index.astype(np.int64)
+            fraction = (index - whole)[:, None].astype(np.float32)
+            self.last = block[-1:]
+            self.phase = (index[-1] + self.step - (len(block) - 1)) if len(index) else self.phase - (len(block) - 1)
+            block = block[whole] * (1 - fraction) + block[whole + 1] * fraction
+
+        with self.lock:
+            self.queue.append(to_output(block, CHANNELS))
+
+    def clear(self):
+        with self.lock:
+            self.queue.clear()
+
+    def active(self):
+        return bool(self.queue)
+
+    def read(self, count):
+        parts = []
+        with self.lock:
+            while count and self.queue:
+                block = self.queue[0]
+                if len(block) <= count:
+                    parts.append(self.queue.popleft())
+                    count -= len(block)
+                else:
+                    parts.append(block[:count])
+                    self.queue[0] = block[count:]
+                    count = 0
+
+        if not parts:
+            return np.zeros((0, CHANNELS), np.float32)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+class Mixer:
+
+    def __init__(self, device=None):
+        self.device = device
+        self.lock = threading.Lock()
+        self.sources = []
+        self.bus_gain = {"music": 1.0, "voice": 1.0, "alarm": 1.0}
+        self.duck = 1.0                 # current music ducking factor
+        self.stream = None
+
+    def start(self):
+        if self.stream:
+            self.stop()
+
+        self.stream = sd.RawOutputStream(
+            samplerate=RATE,
+            blocksize=BLOCK_SIZE,
+            device=self.device,
+            dtype="int16",
+            channels=CHANNELS,
+            latency="low",
+            callback=self.callback
+        )
+        self.stream.start()
+
+    def latency(self):
+        """Seconds between handing audio to the stream and hearing it."""
+        if self.stream is None:
+            return 0.0
+        return self.stream.latency + BLOCK_SIZE / RATE
+
+    def alive(self):
+        return self.stream is not None and self.stream.active
+
+    def stop(self):
+        if self.stream:
+            stream, self.stream = self.stream, None
+            try:
+                stream.stop()
+            finally:
+                stream.close()
+
+    def add(self, source):
+        with self.lock:
+            self.sources.append(source)
+        return source
+
+    def remove(self, source):
+        with self.lock:
+            if source in self.sources:
+                self.sources.remove(source)
+
+    def playing(self, source):
+        with self.lock:
+            return source in self.sources
+
+    def callback(self, outdata, frames, time_info, status):
+        with self.lock:
+            sources = list(self.sources)
+
+        mix = np.zeros((frames, CHANNELS), np.float32)
+
+        ducking = any(s.bus in DUCKING_BUSES and s.active() for s in sources)
+        target = DUCK_GAIN if ducking else 1.0
+        step = frames / (DUCK_RAMP * RATE) * (1 - DUCK_GAIN)
+        if self.duck < target:
+            duck = min(target, self.duck + step)
+        else:
+            duck = max(target, self.duck - step)
+        ramp = np.linspace(self.duck, duck, frames, endpoint=False,
+                           dtype=np.float32)[:, None]
+        self.duck = duck
+
+        ended = []
+        for source in sources:
+            block = source.read(frames)
+            if block is None:
+                ended.append(source)
+                continue
+
+            n = len(block)
+            if not n:
+                continue
+
+            gain = source.gain * self.bus_gain[source.bus]
+            if source.bus == "music":
+                mix[:n] += block * (ramp[:n] * gain)
+            else:
+                mix[:n] += block * gain
+
+        np.clip(mix, -32768, 32767, out=mix)
+        outdata[:] = mix.astype(np.int16).tobytes()
+
+        if ended:
+            with self.lock:
+                for source in ended:
+                    if source in self.sources:
+                        self.sources.remove(source)
+
+            # Never block the audio thread on a listener
+            for source in ended:
+                if source.on_end:
+                    threading.Thread(target=source.on_end, daemon=True).start()
+
+# LOADING
+
+def read_wav(path):
+    """(rate, frames) for a 16-bit PCM WAV, with frames memory-mapped."""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError("not a WAV file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("no data chunk")
+
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + size % 2, 1)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, 1)
+
+    if fmt is None:
+        raise ValueError("no fmt chunk")
+
+    audio_format, channels, rate, _, _, bits = fmt
+    if audio_format not in (1, 0xFFFE) or bits != 16:
+        raise ValueError("only 16-bit PCM WAV is supported")
+
+    # Some writers leave the data size unset; map to the end of the file
+    count = min(size, os.path.getsize(path) - offset) // (2 * channels)
+    frames = np.memmap(path, dtype=np.int16, mode="r", offset=offset,
+                       shape=(count, channels))
+    return rate, frames
+
+class Decode:
+    """One mpg123 run writing an MP3 into the cache. Every source playing
+    the file meanwhile reads from the part written so far."""
+
+    def __init__(self, path, pcm_path):
+        self.path = path
+        self.pcm_path = pcm_path
+        self.decoded = 0                # frames written so far
+        self.frames = None              # the finished track, memory-mapped
+        self.done = False
+        self.progress = threading.Condition()
+
+        fd, self.temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(pcm_path))
+        self.file = os.fdopen(fd, "w+b")
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        frame_bytes = 2 * CHANNELS
+        process = subprocess.Popen(
+            ["mpg123", "-q", "-s", "--stereo", "-r", str(RATE), "-e", "s16", self.path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+        written = 0
+        while True:
+            chunk = process.stdout.read(64 * 1024)
+            if not chunk:
+                break
+            self.file.write(chunk)
+            self.file.flush()
+            written += len(chunk)
+            with self.progress:
+                self.decoded = written // frame_bytes
+                self.progress.notify_all()
+
+        ok = process.wait() == 0 and written > 0
+
+        if ok:
+            os.replace(self.temp_path, self.pcm_path)
+            write_cache_entry(self.pcm_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+        with self.progress:
+            if self.decoded:
+                self.frames = np.memmap(self.file, dtype=np.int16, mode="r",
+                                        shape=(self.decoded, CHANNELS))
+            self.file.close()
+            self.done = True
+            self.progress.notify_all()
+
+        with decodes_lock:
+            decodes.pop(self.pcm_path, None)
+
+        if ok:
+            prune_cache(os.path.dirname(self.pcm_path), keep=self.pcm_path)
+
+    def wait_for_start(self):
+        frames = int(DECODE_START * RATE)
+        with self.progress:
+            self.progress.wait_for(lambda: self.done or self.decoded >= frames,
+                                   DECODE_START_TIMEOUT)
+            if self.done and not self.decoded:
+                raise ValueError("empty decode")
+
+    def read(self, start, count):
+        """Up to count frames from start, b"" if not decoded yet, or None
+        once decoding has finished."""
+        with self.progress:
+            if self.done:
+                return None
+            available = min(count, self.decoded - start)
+            if available <= 0:
+                return b""
+            return os.pread(self.file.fileno(), available * 2 * CHANNELS, start * 2 * CHANNELS)
+
+decodes = {}                    # pcm path -> Decode still running
+decodes_lock = threading.Lock()
+
+class DecodingSource(PcmSource):
+    """An MP3 played while it is being decoded; once the decode finishes
+    it reads like any cached track."""
+
+    def __init__(self, decode, bus="music", gain=1.0, on_end=None):
+        super().__init__(None, RATE, bus=bus, gain=gain, on_end=on_end)
+        self.decode = decode
+
+    def finished(self):
+        if self.frames is None and self.decode.done:
+            self.frames = self.decode.frames
+        return self.frames is not None or self.decode.done
+
+    def active(self):
+        if self.finished():
+            return self.frames is not None and super().active()
+        return not self.paused
+
+    def seek(self, seconds):
+        if self.finished():
+            if self.frames is not None:
+                super().seek(seconds)
+            return
+        self.position = float(min(max(0, int(seconds * RATE)), self.decode.decoded))
+
+    def read(self, count):
+        if self.paused:
+            return np.zeros((0, CHANNELS), np.float32)
+
+        if not self.finished():
+            start = int(self.position)
+            data = self.decode.read(start, count)
+
+            if data:
+                block = np.frombuffer(data, np.int16).reshape(-1, CHANNELS).astype(np.float32)
+                self.position = start + len(block)
+                return block
+
+            if data is not None:
+                # The decoder fell behind: a moment of silence, not an end
+                return np.zeros((count, CHANNELS), np.float32)
+
+            self.finished()
+
+        if self.frames is None:
+            return None
+        return super().read(count)
+
+# MP3 CACHE
+#
+# One entry per source file: <hash of its path>.pcm, with a .json beside it
+# recording the size and mtime it was decoded from. A changed file replaces
+# its own entry; entries whose source changed or disappeared are pruned.
+
+def cache_paths(path, cache_dir):
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    base = os.path.join(cache_dir, name)
+    return base + ".pcm", base + ".json"
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+def write_cache_entry(pcm_path, path):
+    info_path = pcm_path[:-len(".pcm")] + ".json"
+    with open(info_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(source_stamp(path), f, ensure_ascii=False)
+    os.replace(info_path + ".tmp", info_path)
+
+def cache_entry_valid(info_path):
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        return source_stamp(info["path"]) == info
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+def remove_quietly(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def prune_cache(cache_dir, max_bytes=CACHE_MAX_BYTES, keep=None):
+    """Drops entries whose source changed or is gone, then the least
+    recently played ones until the cache fits in max_bytes."""
+    entries = []
+    now = time.time()
+
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    for name in names:
+        path = os.path.join(cache_dir, name)
+
+        if name.endswith(".tmp"):
+            try:
+                if now - os.path.getmtime(path) > STALE_TEMP_AGE:
+                    remove_quietly(path)
+            except OSError:
+                pass
+            continue
+
+        if not name.endswith(".pcm"):
+            continue
+
+        info_path = path[:-len(".pcm")] + ".json"
+        if not cache_entry_valid(info_path):
+            remove_quietly(path, info_path)
+            continue
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path, info_path))
+
+    total = sum(size for _, size, _, _ in entries)
+    for _, size, path, info_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        remove_quietly(path, info_path)
+        total -= size
+
+def open_cached_mp3(path, cache_dir):
+    """(rate, frames) of an MP3 decoded earlier, or None."""
+    pcm_path, info_path = cache_paths(path, cache_dir)
+    if not os.path.exists(pcm_path) or not cache_entry_valid(info_path):
+        return None
+
+    count = os.path.getsize(pcm_path) // (2 * CHANNELS)
+    if not count:
+        return None
+
+    # The mtime is the last play, for pruning
+    os.utime(pcm_path)
+    return RATE, np.memmap(pcm_path, dtype=np.int16, mode="r", shape=(count, CHANNELS))
+
+def load_track(path, cache_dir, bus="music", gain=1.0, on_end=None):
+    if not path.lower().endswith(".mp3"):
+        rate, frames = read_wav(path)
+        return PcmSource(frames, rate, bus=bus, gain=gain, on_end=on_end)
+
+    cached = open_cached_mp3(path, cache_dir)
+    if cached:
+        rate, frames = cached
+        return PcmSource(frames, rate, bus=bus, gain=gain, on_end=on_end)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    pcm_path, _ = cache_paths(path, cache_dir)
+
+    # The playlist loads the next track ahead; playing it joins that decode
+    with decodes_lock:
+        decode = decodes.get(pcm_path)
+        if decode is None:
+            decode = decodes[pcm_path] = Decode(path, pcm_path)
+
+    decode.wait_for_start()
+    return DecodingSource(decode, bus=bus, gain=gain, on_end=on_end)
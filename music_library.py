@@ -0,0 +1,408 @@
+import bisect
+import json
+import os
+import re
+import struct
+import threading
+
+from file_watch import DirectoryWatcher
+
+# MUSIC LIBRARY
+#
+# The songs folder is scanned recursively in the background and every
+# track's title, artist, format and duration is kept in an on-disk index.
+# Rescans only read tags from files whose size or mtime changed, so starting
+# a song never waits on the filesystem however many tracks there are.
+#
+# Names are searched by sound rather than by spelling: Hindi queries from
+# the recognizer and Latin file names are both reduced to the same rough
+# phonetic key, so "अरिजीत" finds "Arijit Singh - Tum Hi Ho.mp3".
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+INDEX_VERSION = 1
+RESCAN_INTERVAL = 300         # seconds between rescans without inotify
+
+# PHONETIC KEYS
+
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+NUKTA_CONSONANTS = {"क": "q", "ख": "kh", "ग": "g", "ज": "z", "फ": "f", "ड": "r", "ढ": "rh"}
+PRECOMPOSED = {"क़": "क", "ख़": "ख", "ग़": "ग", "ज़": "ज", "ड़": "ड", "ढ़": "ढ", "फ़": "फ"}
+
+VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऋ": "ri",
+}
+MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ृ": "ri",
+}
+NASALS = {"ं": "n", "ँ": "n", "ः": "h"}
+NUKTA = "़"
+HALANT = "्"
+
+# Spelling variants that sound the same
+KEY_REPLACEMENTS = [
+    ("ee", "i"), ("oo", "u"), ("ph", "f"), ("w", "v"), ("z", "j"),
+    ("q", "k"), ("ck", "k"), ("x", "ks"), ("c", "k"), ("y", "i"),
+]
+
+def transliterate(word):
+    """Rough Latin spelling of a Devanagari word, with the inherent 'a'
+    dropped where Hindi does not pronounce it."""
+    for composed, base in PRECOMPOSED.items():
+        word = word.replace(composed, base + NUKTA)
+
+    # [consonant, vowel, vowel is the inherent a]
+    units = []
+    i = 0
+    while i < len(word):
+        char = word[i]
+
+        if char in CONSONANTS:
+            sound = CONSONANTS[char]
+            if i + 1 < len(word) and word[i + 1] == NUKTA:
+                sound = NUKTA_CONSONANTS.get(char, sound)
+                i += 1
+            units.append([sound, "a", True])
+        elif char in MATRAS and units:
+            units[-1][1:] = [MATRAS[char], False]
+        elif char == HALANT and units:
+            units[-1][1:] = ["", False]
+        elif char in VOWELS:
+            units.append(["", VOWELS[char], False])
+        elif char in NASALS and units:
+            units[-1][1] += NASALS[char]
+        else:
+            units.append([char, "", False])
+        i += 1
+
+    # Schwa deletion: word-final, and between a vowel and a full syllable
+    if units and units[-1][2] and len(units) > 1:
+        units[-1][1] = ""
+    for j in range(len(units) - 2, 0, -1):
+        if units[j][2] and units[j - 1][1] and units[j + 1][1] and units[j + 1][0]:
+            units[j][1] = ""
+
+    return "".join(consonant + vowel for consonant, vowel, _ in units)
+
+def phonetic_key(word):
+    word = transliterate(word.lower())
+    word = re.sub(r"[^a-z0-9]", "", word)
+
+    for old, new in KEY_REPLACEMENTS:
+        word = word.replace(old, new)
+
+    # Aspiration, doubled letters, final vowels and the short a inside a
+    # word are all spelt every which way in Latin names
+    word = re.sub(r"(?<=[^aeiou])h", "", word)
+    word = re.sub(r"(.)\1+", r"\1", word)
+
+    if len(word) > 2 and word[-1] in "ae":
+        word = word[:-1]
+
+    return word[:1] + re.sub(r"(?<=[^aeiou])a(?=[^aeiou])", "", word[1:])
+
+def tokenize(text):
+    return [t for t in re.split(r"[\W_]+", text) if t]
+
+# TAGS
+
+def read_wav_info(path):
+    """Duration and LIST/INFO title and artist of a WAV file."""
+    info = {"format": "wav", "duration": None, "title": None, "artist": None}
+
+    with open(path, "rb") as f:
+        if f.read(12)[8:] != b"WAVE":
+            return info
+
+        byte_rate = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+
+            chunk_id, size = struct.unpack("<4sI", header)
+
+            if chunk_id == b"fmt ":
+                fmt = f.read(size)
+                byte_rate = struct.unpack("<I", fmt[8:12])[0]
+                if size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b"data":
+                if byte_rate:
+                    size = min(size, os.path.getsize(path) - f.tell())
+                    info["duration"] = size / byte_rate
+                f.seek(size + size % 2, 1)
+            elif chunk_id == b"LIST":
+                body = f.read(size + size % 2)
+                if body[:4] == b"INFO":
+                    offset = 4
+                    while offset + 8 <= len(body):
+                        tag, length = struct.unpack("<4sI", body[offset:offset + 8])
+                        value = body[offset + 8:offset + 8 + length]
+                        value = value.split(b"\0")[0].decode("utf-8", "replace").strip()
+                        if tag == b"INAM" and value:
+                            info["title"] = value
+                        elif tag == b"IART" and value:
+                            info["artist"] = value
+                        offset += 8 + length + length % 2
+            else:
+                f.seek(size + size % 2, 1)
+
+    return info
+
+def decode_id3_text(data):
+    if not data:
+        return ""
+
+    encoding, text = data[0], data[1:]
+    if encoding == 1:
+        text = text.decode("utf-16", "replace")
+    elif encoding == 2:
+        text = text.decode("utf-16-be", "replace")
+    elif encoding == 3:
+        text = text.decode("utf-8", "replace")
+    else:
+        text = text.decode("latin-1")
+
+    return text.split("\0")[0].strip()
+
+def syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def read_mp3_info(path):
+    """Title and artist from ID3v2 (or ID3v1) tags, and the duration from
+    the Xing header or, failing that, the first frame's bitrate."""
+    info = {"format": "mp3", "duration": None, "title": None, "artist": None}
+    file_size = os.path.getsize(path)
+
+    with open(path, "rb") as f:
+        head = f.read(10)
+        audio_start = 0
+
+        if head[:3] == b"ID3" and len(head) == 10:
+            major = head[3]
+            tag_size = syncsafe(head[6:10])
+            tag = f.read(tag_size)
+            audio_start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+
+            frames = {"TIT2": "title", "TPE1": "artist", "TT2": "title", "TP1": "artist"}
+            id_size, header_size = (3, 6) if major == 2 else (4, 10)
+            offset = 0
+            while offset + header_size <= len(tag):
+                frame_id = tag[offset:offset + id_size].decode("latin-1")
+                if not frame_id.strip("\0"):
+                    break
+
+                size_bytes = tag[offset + id_size:offset + header_size - (0 if major == 2 else 2)]
+                if major == 2:
+                    size = int.from_bytes(size_bytes, "big")
+                elif major == 4:
+                    size = syncsafe(size_bytes)
+                else:
+                    size = struct.unpack(">I", size_bytes)[0]
+
+                body = tag[offset + header_size:offset + header_size + size]
+                if frame_id in frames and not info[frames[frame_id]]:
+                    info[frames[frame_id]] = decode_id3_text(body) or None
+
+                offset += header_size + size
+
+        # First MPEG audio frame
+        f.seek(audio_start)
+        data = f.read(4096)
+        position = data.find(b"\xff")
+        while 0 <= position < len(data) - 4 and (data[position + 1] & 0xE0) != 0xE0:
+            position = data.find(b"\xff", position + 1)
+
+        if 0 <= position < len(data) - 4:
+            version = (data[position + 1] >> 3) & 3      # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+            layer = (data[position + 1] >> 1) & 3        # 1 = layer III
+            bitrate_index = data[position + 2] >> 4
+            rate_index = (data[position + 2] >> 2) & 3
+            mono = (data[position + 3] >> 6) == 3
+
+            if layer == 1 and version in MP3_RATES and rate_index < 3 and 0 < bitrate_index < 15:
+                rate = MP3_RATES[version][rate_index]
+                bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+                samples = 1152 if version == 3 else 576
+
+                side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+                xing = position + 4 + side_info
+                if data[xing:xing + 4] in (b"Xing", b"Info") and data[xing + 7] & 1:
+                    frame_count = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+                    info["duration"] = frame_count * samples / rate
+                else:
+                    info["duration"] = (file_size - audio_start - position) * 8 / bitrate
+
+        if not info["title"] and file_size > 128:
+            f.seek(-128, 2)
+            tail = f.read(128)
+            if tail[:3] == b"TAG":
+                info["title"] = tail[3:33].split(b"\0")[0].decode("latin-1").strip() or None
+                info["artist"] = tail[33:63].split(b"\0")[0].decode("latin-1").strip() or None
+
+    return info
+
+def read_track_info(path):
+    if path.lower().endswith(".mp3"):
+        info = read_mp3_info(path)
+    else:
+        info = read_wav_info(path)
+
+    # Untagged files are usually named "Artist - Title"
+    if not info["title"]:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if " - " in stem and not info["artist"]:
+            info["artist"], info["title"] = [p.strip() for p in stem.split(" - ", 1)]
+        else:
+            info["title"] = stem
+
+    return info
+
+# LIBRARY
+
+class MusicLibrary:
+
+    def __init__(self, root, index_path):
+        self.root = root
+        self.index_path = index_path
+        self.tracks = {}                # relative path -> track dict
+        self.keys = []                  # sorted phonetic keys
+        self.postings = {}              # phonetic key -> set of relative paths
+        self.ready = threading.Event()
+        self.scan_lock = threading.Lock()
+        self.watcher = None
+
+    def load(self):
+        """Loads the saved index; the library is usable right away."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.set_tracks(data["tracks"])
+                self.ready.set()
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self, tracks):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "tracks": tracks}, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+
+    def start(self):
+        """Rescans in the background, then keeps the index up to date."""
+        def run():
+            self.scan()
+            self.watcher = DirectoryWatcher([self.root], lambda changed: self.scan(),
+                                            recursive=True, poll_interval=RESCAN_INTERVAL)
+            self.watcher.start()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def scan(self):
+        """Brings the index up to date, reading tags only from new or
+        changed files."""
+        with self.scan_lock:
+            old = self.tracks
+            tracks = {}
+            changed = False
+
+            for root, dirs, files in os.walk(self.root):
+                dirs.sort()
+                for name in sorted(files):
+                    if not name.lower().endswith(AUDIO_EXTENSIONS):
+                        continue
+
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, self.root)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    track = old.get(relative)
+                    if track and track["mtime"] == stat.st_mtime and track["size"] == stat.st_size:
+                        tracks[relative] = track
+                        continue
+
+                    try:
+                        info = read_track_info(path)
+                    except (OSError, ValueError, IndexError, struct.error) as e:
+                        print(f"⚠ Could not read {relative}:", e)
+                        continue
+
+                    info.update(path=relative, mtime=stat.st_mtime, size=stat.st_size)
+                    tracks[relative] = info
+                    changed = True
+
+            if changed or tracks.keys() != old.keys():
+                self.set_tracks(tracks)
+                self.save(tracks)
+                print(f"🎵 Music library: {len(tracks)} tracks")
+
+            self.ready.set()
+
+    def set_tracks(self, tracks):
+        postings = {}
+        for relative, track in tracks.items():
+            words = tokenize(track["title"] or "") + tokenize(track["artist"] or "")
+            words += tokenize(os.path.splitext(relative)[0])
+            for word in words:
+                key = phonetic_key(word)
+                if len(key) > 1:
+                    postings.setdefault(key, set()).add(relative)
+
+        # Swapped in whole so searches never see a half-built index
+        self.tracks, self.postings, self.keys = tracks, postings, sorted(postings)
+
+    # LOOKUP
+
+    def path(self, track):
+        return os.path.join(self.root, track["path"])
+
+    def all_tracks(self):
+        return sorted(self.tracks.values(), key=lambda t: t["path"])
+
+    def search(self, words):
+        """Tracks matching the query words, best first. A word matches a
+        name word with the same phonetic key, or one that starts with it."""
+        tracks, postings, keys = self.tracks, self.postings, self.keys
+        matched = {}
+        score = {}
+
+        for word in words:
+            key = phonetic_key(word)
+            if len(key) < 2:
+                continue
+
+            hits = {}
+            start = bisect.bisect_left(keys, key)
+            for name_key in keys[start:]:
+                if not name_key.startswith(key):
+                    break
+                weight = 2 if name_key == key else 1
+                for relative in postings[name_key]:
+                    hits[relative] = max(hits.get(relative, 0), weight)
+
+            for relative, weight in hits.items():
+                matched[relative] = matched.get(relative, 0) + 1
+                score[relative] = score.get(relative, 0) + weight
+
+        best = sorted(matched, key=lambda r: (-matched[r], -score[r], r))
+        return [tracks[r] for r in best]
@@ -0,0 +1,305 @@
+import collections
+import random
+import threading
+
+import numpy as np
+
+from mixer import CHANNELS
+
+# PLAYLIST
+#
+# The playlist is a single source on the mixer's music bus. When a track
+# runs out mid-block the rest of the block is read from the next track,
+# so consecutive tracks play without a gap. The next track is loaded in
+# the background as soon as the current one starts, so moving on is just a
+# change of pointer. For an MP3 that starts its decode, which the track
+# keeps reading from as it plays, into the same capped cache.
+#
+# Track changes often happen in the mixer's audio callback, which must not
+# block or start threads; on_track and on_end are run by the loader thread.
+
+REPEAT_MODES = ("off", "one", "all")
+
+class PlaylistSource:
+    """Mixer source that reads through the playlist's tracks."""
+
+    def __init__(self, playlist):
+        self.playlist = playlist
+        self.bus = "music"
+        self.gain = 1.0
+        self.on_end = None
+        self.paused = False
+
+    def active(self):
+        current = self.playlist.current_source
+        return not self.paused and current is not None
+
+    def read(self, count):
+        if self.paused:
+            return np.zeros((0, CHANNELS), np.float32)
+
+        parts = []
+        while count:
+            current = self.playlist.current_source
+            if current is None:
+                break
+
+            block = current.read(count)
+            if block is not None and len(block):
+                parts.append(block)
+                count -= len(block)
+
+            if block is None or len(block) == 0 or count:
+                # Track finished inside this block
+                if not self.playlist.advance(from_audio=True):
+                    break
+
+        if not parts:
+            # Silence while a late track loads; None only once it is over
+            return None if self.playlist.finished else np.zeros((0, CHANNELS), np.float32)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+class Playlist:
+
+    def __init__(self, mixer, load, on_track=None, on_end=None):
+        self.mixer = mixer
+        self.load = load                # track -> PcmSource
+        self.on_track = on_track        # called with each track as it starts
+        self.on_end = on_end            # called when the playlist runs out
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.order = []                 # indexes into tracks, in play order
+        self.position = 0
+        self.shuffle = False
+        self.repeat = "off"
+        self.current_source = None
+        self.finished = False
+        self.preloaded = {}             # position -> loaded source
+        self.notices = collections.deque()  # (callback, args) for the loader to run
+        self.source = PlaylistSource(self)
+        self.wanted = threading.Condition(self.lock)
+        self.loader = threading.Thread(target=self.load_ahead, daemon=True)
+        self.loader.start()
+
+    # CONTROL
+
+    def play(self, tracks, start=0):
+        with self.lock:
+            self.tracks = list(tracks)
+            self.order = list(range(len(self.tracks)))
+            if self.shuffle:
+                self.shuffle_order(start)
+                start = 0
+            self.preloaded = {}
+
+        return self.jump(start)
+
+    def stop(self):
+        self.mixer.remove(self.source)
+        with self.lock:
+            self.current_source = None
+            self.preloaded = {}
+            self.tracks = []
+            self.order = []
+
+    def next(self):
+        return self.advance(manual=True)
+
+    def previous(self):
+        with self.lock:
+            if not self.order:
+                return False
+            position = (self.position - 1) % len(self.order)
+        return self.jump(position)
+
+    def set_shuffle(self, on):
+        with self.lock:
+            self.shuffle = on
+            if not self.order:
+                return
+            current = self.order[self.position]
+            if on:
+                self.shuffle_order(current)
+            else:
+                self.order = list(range(len(self.tracks)))
+                self.position = current
+            # Whatever was loaded ahead is probably not next any more
+            self.preloaded = {}
+            self.wanted.notify()
+
+    def set_repeat(self, mode):
+        with self.lock:
+            self.repeat = mode
+            self.preloaded = {}
+            self.wanted.notify()
+
+    # STATE
+
+    def playing(self):
+        return not self.finished and self.mixer.playing(self.source)
+
+    # INTERNALS
+
+    def shuffle_order(self, first):
+        """Called with the lock held: random order starting with first."""
+        rest = [i for i in range(len(self.tracks)) if i != first]
+        random.shuffle(rest)
+        self.order = [first] + rest
+        self.position = 0
+
+    def next_position(self, manual=False):
+        """Called with the lock held: position after the current one, or
+        None. Asking for the next track skips past a repeated one."""
+        if self.repeat == "one" and not manual:
+            return self.position
+        if self.position + 1 < len(self.order):
+            return self.position + 1
+        return 0 if self.repeat != "off" and self.order else None
+
+    def jump(self, position):
+        """Starts the track at position, loading it here if need be."""
+        with self.lock:
+            source = self.preloaded.pop(position, None)
+            track = self.tracks[self.order[position]] if position < len(self.order) else None
+
+        if track is None:
+            return False
+
+        if source is None:
+            try:
+                source = self.load(track)
+            except Exception as e:
+                print("⚠ Track could not be loaded:", e)
+                return False
+
+        self.start(position, source, track)
+        return True
+
+    def advance(self, from_audio=False, manual=False):
+        """Moves on to the next track. From the audio thread only a track
+        that is already loaded is used; otherwise playback pauses until
+        the loader has it ready."""
+        with self.lock:
+            position = self.next_position(manual)
+
+            if position is None:
+                if manual:
+                    return False
+                self.current_source = None
+                self.finished = True
+                self.notify_later(self.on_end)
+                ended = True
+            else:
+                ended = False
+                source = self.preloaded.pop(position, None)
+                if source is None and position == self.position and self.current_source:
+                    # Repeat one: play the same track again
+                    source = self.current_source
+                    source.seek(0)
+
+        if ended:
+            return False
+
+        if source is None:
+            if from_audio:
+                with self.lock:
+                    self.position = position
+                    self.current_source = None
+                    self.wanted.notify()
+                return False
+            return self.jump(position)
+
+        with self.lock:
+            track = self.tracks[self.order[position]]
+        self.start(position, source, track, from_audio)
+        return True
+
+    def start(self, position, source, track, from_audio=False):
+        with self.lock:
+            self.position = position
+            self.current_source = source
+            self.finished = False
+            self.notify_later(self.on_track, track)
+            self.wanted.notify()
+
+        # The mixer drops the playlist once it runs out; previous() or
+        # next() after that has to put it back. The audio thread only gets
+        # here while the playlist is still on the mixer.
+        if not from_audio:
+            self.source.paused = False
+            if not self.mixer.playing(self.source):
+                self.mixer.add(self.source)
+
+    def notify_later(self, callback, *args):
+        """Called with the lock held: callback runs on the loader thread."""
+        if callback:
+            self.notices.append((callback, args))
+            self.wanted.notify()
+
+    def load_ahead(self):
+        """Loader thread: keeps the next track decoded and ready, picks up a
+        track the audio thread had to wait for, and runs the callbacks."""
+        while True:
+            with self.lock:
+                while True:
+                    if self.notices:
+                        notices = list(self.notices)
+                        self.notices.clear()
+                        position = None
+                        break
+
+                    if self.order and self.current_source is None and not self.finished and \
+                            self.mixer.playing(self.source) and self.position not in self.preloaded:
+                        position, resume = self.position, True
+                        break
+
+                    position = self.next_position() if self.current_source else None
+                    if position is not None and position != self.position and \
+                            position not in self.preloaded:
+                        resume = False
+                        break
+
+                    self.wanted.wait()
+
+                if position is not None:
+                    track = self.tracks[self.order[position]]
+                    order = self.order
+
+            if position is None:
+                for callback, args in notices:
+                    try:
+                        callback(*args)
+                    except Exception as e:
+                        print("⚠ Playlist callback failed:", e)
+                continue
+
+            try:
+                source = self.load(track)
+            except Exception as e:
+                print("⚠ Track could not be loaded:", e)
+                with self.lock:
+                    # Drop it from the order rather than trying again for ever
+                    if order is self.order:
+                        self.order = order[:position] + order[position + 1:]
+                        if self.position > position:
+                            self.position -= 1
+                        self.preloaded = {}
+                        if not self.order:
+                            self.finished = True
+                continue
+
+            with self.lock:
+                if order is not self.order:
+                    continue
+                if self.current_source is None and self.position == position and \
+                        not self.finished:
+                    # The audio thread got here while it was loading
+                    resume = True
+                if resume:
+                    self.position = position
+                    self.current_source = source
+                else:
+                    self.preloaded[position] = source
+
+            if resume and self.on_track:
+                self.on_track(track)
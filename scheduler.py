@@ -0,0 +1,324 @@
+import datetime
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+# SCHEDULER
+#
+# One thread runs every timer, alarm and reminder. Jobs sit in a heap and the
+# thread sleeps on a condition variable until the earliest one is due or the
+# heap changes.
+#
+# Relative jobs ("in 10 minutes") use the monotonic clock so they are not
+# disturbed by clock changes. Wall-clock jobs ("at 7:30") are compared with
+# the system time, which on a Pi without an RTC can jump when NTP syncs, so
+# the thread re-checks them at least every WALL_CLOCK_RECHECK seconds.
+
+WALL_CLOCK_RECHECK = 30
+
+# Journal writes are flushed to the OS at once but fsync'd at most this often
+FSYNC_INTERVAL = 1.0
+# Rewrite the journal once it holds this many records per pending job
+COMPACT_RATIO = 4
+
+class Job:
+
+    def __init__(self, job_id, name, kind, callback, due, wall_clock, data=None):
+        self.id = job_id
+        self.name = name
+        self.kind = kind
+        self.callback = callback
+        self.due = due                  # time.monotonic() or datetime
+        self.wall_clock = wall_clock
+        self.data = data                # JSON-able; only jobs with data are persisted
+        self.cancelled = False
+
+    def remaining(self):
+        """Seconds until the job fires."""
+        if self.wall_clock:
+            return max(0.0, (self.due - datetime.datetime.now()).total_seconds())
+        return max(0.0, self.due - time.monotonic())
+
+    def record(self):
+        """Journal entry; due is stored as a Unix timestamp either way."""
+        if self.wall_clock:
+            due = self.due.timestamp()
+        else:
+            due = time.time() + self.due - time.monotonic()
+
+        return {"op": "add", "id": self.id, "name": self.name, "kind": self.kind,
+                "due": due, "wall_clock": self.wall_clock, "data": self.data}
+
+class ScheduleStore:
+    """Append-only JSON lines journal of scheduled jobs.
+
+    Each line is an "add", "done" or "cancel" record. A torn last line from a
+    power cut is ignored on load."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.dirty = False
+        self.last_sync = 0
+        self.records = 0
+
+    def load(self):
+        """Returns the add records of jobs that are still pending."""
+        pending = {}
+        self.lines = {}
+        self.records = 0
+
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                self.records += 1
+                if record["op"] == "add":
+                    pending[record["id"]] = record
+                    self.lines[record["id"]] = line
+                else:
+                    pending.pop(record["id"], None)
+                    self.lines.pop(record["id"], None)
+
+        return list(pending.values())
+
+    def append(self, record):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.dirty = True
+        self.records += 1
+
+    def sync(self, force=False):
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.last_sync < FSYNC_INTERVAL:
+            return
+
+        os.fsync(self.file.fileno())
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def compact(self, records=(), lines=()):
+        """Atomically replaces the journal with just the given add records
+        (dicts, or raw lines as returned by load)."""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self.path)
+        self.records = len(lines) + len(records)
+        self.dirty = False
+
+    def close(self):
+        if self.file:
+            self.sync(force=True)
+            self.file.close()
+            self.file = None
+
+class Scheduler:
+
+    def __init__(self, store=None):
+        self.store = store
+        self.cond = threading.Condition()
+        self.monotonic_heap = []
+        self.wall_heap = []
+        self.active = {}                # job id -> Job
+        self.ids = itertools.count(1)
+        self.thread = None
+        self.running = False
+
+    # SCHEDULING
+
+    def schedule_in(self, seconds, callback, name="", kind="timer", data=None):
+        return self.add(time.monotonic() + seconds, False, callback, name, kind, data)
+
+    def schedule_at(self, when, callback, name="", kind="alarm", data=None):
+        return self.add(when, True, callback, name, kind, data)
+
+    def add(self, due, wall_clock, callback, name, kind, data=None, job_id=None):
+        with self.cond:
+            job = Job(job_id or next(self.ids), name, kind, callback,
+                      due, wall_clock, data)
+            heap = self.wall_heap if wall_clock else self.monotonic_heap
+            heapq.heappush(heap, (due, job.id, job))
+            self.active[job.id] = job
+
+            if job_id is None:
+                self.journal(job, job.record())
+
+            self.ensure_running()
+            self.cond.notify()
+
+        return job
+
+    def journal(self, job, record):
+        if self.store and job.data is not None:
+            self.store.append(record)
+
+    # PERSISTENCE
+
+    def restore(self, make_callback):
+        """Re-schedules the jobs saved in the store. make_callback(kind, data)
+        rebuilds a job's callback. Returns [(record, seconds late)] for jobs
+        that came due while the assistant was not running."""
+        records = self.store.load()
+        now = time.time()
+        missed = []
+
+        # Hold the lock for the whole replay so the worker wakes up once
+        with self.cond:
+            for record in records:
+                late = now - record["due"]
+                if late >= 0:
+                    missed.append((record, late))
+                    continue
+
+                callback = make_callback(record["kind"], record["data"])
+                if record["wall_clock"]:
+                    due = datetime.datetime.fromtimestamp(record["due"])
+                else:
+                    due = time.monotonic() - late
+
+                self.add(due, record["wall_clock"], callback, record["name"],
+                         record["kind"], record["data"], job_id=record["id"])
+
+            if records:
+                self.ids = itertools.count(max(r["id"] for r in records) + 1)
+
+            # Missed jobs are handled by the caller; drop them and any
+            # done / cancelled entries from the journal
+            if self.store.records > len(records) - len(missed):
+                self.store.compact(lines=[self.store.lines[r["id"]] for r in records
+                                          if r["id"] in self.active])
+
+        return missed
+
+    def cancel(self, job):
+        """Cancelled jobs stay in the heap and are skipped when popped."""
+        with self.cond:
+            if self.active.pop(job.id, None) is None:
+                return False
+            job.cancelled = True
+            self.journal(job, {"op": "cancel", "id": job.id})
+            self.cond.notify()
+            return True
+
+    def cancel_kind(self, kind):
+        with self.cond:
+            jobs = [job for job in self.active.values() if job.kind == kind]
+            for job in jobs:
+                self.cancel(job)
+            return len(jobs)
+
+    def jobs(self, kind=None):
+        """Pending jobs, soonest first."""
+        with self.cond:
+            jobs = [job for job in self.active.values()
+                    if kind is None or job.kind == kind]
+        return sorted(jobs, key=lambda job: job.remaining())
+
+    # WORKER
+
+    def ensure_running(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+            if self.store:
+                self.store.close()
+
+    def maintain_store(self):
+        """Called with the lock held: batched fsync and compaction."""
+        if not self.store or self.store.file is None:
+            return
+
+        pending = sum(1 for job in self.active.values() if job.data is not None)
+        if self.store.records > COMPACT_RATIO * max(pending, 16):
+            self.store.compact(records=[job.record() for job in self.active.values()
+                                        if job.data is not None])
+        else:
+            self.store.sync()
+
+    def pop_due(self):
+        """Removes and returns every job that is due, plus the wait until
+        the next one."""
+        due_jobs = []
+        wait = None
+
+        for heap, now, wall_clock in (
+                (self.monotonic_heap, time.monotonic(), False),
+                (self.wall_heap, datetime.datetime.now(), True)):
+
+            while heap and heap[0][2].cancelled:
+                heapq.heappop(heap)
+
+            while heap and heap[0][0] <= now:
+                job = heapq.heappop(heap)[2]
+                if not job.cancelled:
+                    due_jobs.append(job)
+                while heap and heap[0][2].cancelled:
+                    heapq.heappop(heap)
+
+            if heap:
+                if wall_clock:
+                    seconds = (heap[0][0] - now).total_seconds()
+                    seconds = min(seconds, WALL_CLOCK_RECHECK)
+                else:
+                    seconds = heap[0][0] - now
+                wait = seconds if wait is None else min(wait, seconds)
+
+        for job in due_jobs:
+            self.active.pop(job.id, None)
+
+        return due_jobs, wait
+
+    def run(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+
+                self.maintain_store()
+
+                due_jobs, wait = self.pop_due()
+                if not due_jobs:
+                    if self.store and self.store.dirty:
+                        wait = FSYNC_INTERVAL if wait is None else min(wait, FSYNC_INTERVAL)
+                    self.cond.wait(wait)
+                    continue
+
+            for job in due_jobs:
+                try:
+                    job.callback()
+                except Exception as e:
+                    print(f"⚠ Scheduled job '{job.name}' failed:", e)
+
+                # Marked done only after it ran, so a power cut mid-alarm
+                # rings it again on the next start
+                with self.cond:
+                    self.journal(job, {"op": "done", "id": job.id})
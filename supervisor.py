@@ -0,0 +1,147 @@
+import threading
+import time
+
+# SUPERVISOR
+#
+# Keeps long-running parts of the assistant (the piper process, the ASR
+# worker, the audio output stream) alive. Each service is checked every
+# CHECK_INTERVAL seconds and restarted as soon as it is found dead, so piper
+# has its model loaded again before the next answer. A service that keeps failing is
+# retried with exponential backoff so a broken install does not spin.
+
+CHECK_INTERVAL = 1.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+STABLE_TIME = 60.0            # up this long = forget earlier failures
+
+class Service:
+
+    def __init__(self, name, start, stop, alive):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.alive = alive
+        self.running = False
+        self.restarts = 0
+        self.failures = 0               # in a row, for the backoff
+        self.started_at = 0.0
+        self.retry_at = 0.0
+        self.last_error = None
+
+class Supervisor:
+
+    def __init__(self):
+        self.services = []
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def add(self, name, start, stop, alive):
+        service = Service(name, start, stop, alive)
+        self.services.append(service)
+        return service
+
+    def add_running(self, name, start, stop, alive):
+        """For a service its caller has already started (and seen come up),
+        possibly while start() is running on another thread."""
+        service = Service(name, start, stop, alive)
+        service.running = True
+        service.started_at = time.monotonic()
+        with self.cond:
+            self.services.append(service)
+        return service
+
+    def start(self):
+        """Starts every service in order, then watches them."""
+        for service in self.services:
+            if not service.running:
+                self.launch(service)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def report_failure(self, service, reason):
+        """For callers that notice a failure first (e.g. a broken pipe)."""
+        with self.cond:
+            if service.running:
+                self.mark_down(service, reason)
+            self.cond.notify()
+
+    def check_now(self):
+        with self.cond:
+            self.cond.notify()
+
+    def stats(self):
+        return {service.name: {"up": service.running,
+                               "restarts": service.restarts,
+                               "last_error": service.last_error}
+                for service in self.services}
+
+    # INTERNALS
+
+    def mark_down(self, service, reason):
+        service.running = False
+        service.last_error = reason
+
+        if time.monotonic() - service.started_at > STABLE_TIME:
+            service.failures = 0
+
+        # First failure: straight back up; then 1s, 2s, 4s ...
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (service.failures - 1)) \
+            if service.failures else 0
+        service.failures += 1
+        service.retry_at = time.monotonic() + delay
+        print(f"⚠ {service.name} down ({reason}), restarting in {delay:.0f}s")
+
+        try:
+            service.stop()
+        except Exception:
+            pass
+
+    def launch(self, service):
+        """Called without the lock: starting a service can take seconds
+        (piper loads its model), and report_failure() and check_now()
+        must not wait for that."""
+        try:
+            service.start()
+            error = None
+        except Exception as e:
+            error = e
+
+        with self.cond:
+            service.running = True
+            if error:
+                # running is set so mark_down schedules a retry
+                self.mark_down(service, f"start failed: {error}")
+                return False
+
+            service.started_at = time.monotonic()
+            return True
+
+    def run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                due = []
+
+                for service in self.services:
+                    if service.running:
+                        try:
+                            alive = service.alive()
+                        except Exception:
+                            alive = False
+                        if not alive:
+                            self.mark_down(service, "not responding")
+
+                    if not service.running and now >= service.retry_at:
+                        due.append(service)
+
+                if not due:
+                    waits = [s.retry_at - now for s in self.services if not s.running]
+                    self.cond.wait(max(0.05, min([CHECK_INTERVAL] + waits)))
+                    continue
+
+            for service in due:
+                if self.launch(service):
+                    service.restarts += 1
+                    print(f"🔁 {service.name} restarted "
+                          f"({service.restarts} restarts so far)")
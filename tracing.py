@@ -0,0 +1,267 @@
+import collections
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import socket
+import socketserver
+import threading
+import time
+
+# TRACING
+#
+# Each utterance gets one trace: a set of named timestamps from speech onset
+# to the end of the spoken answer. Only the handful of events per utterance
+# are recorded on the hot path (one clock read and a dict store each);
+# histograms and the log line are produced once the trace is complete.
+#
+# Traces are kept by key, since a command's handler can still be running
+# while the next utterance is heard. Marks without a key go to the thread's
+# bound trace (see bind()), else to the utterance being heard.
+#
+# Metrics are served in Prometheus text format on a local Unix socket, to
+# plain readers and to HTTP clients alike:
+#
+#     curl --unix-socket /tmp/veer_metrics.sock http://localhost/metrics
+
+# Commands whose trace never completes (a handler that failed) are
+# forgotten past this many
+MAX_OPEN_TRACES = 20
+
+# Upper bounds in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+
+# Derived stages: (name, from event, to event)
+STAGES = [
+    ("wake_to_final", "wake", "asr_final"),
+    ("speech_end_to_final", "speech_end", "asr_final"),
+    ("routing", "asr_final", "intent"),
+    ("handler", "intent", "handler_done"),
+    ("tts_first_byte", "tts_request", "tts_first_byte"),
+    ("playback", "tts_first_byte", "tts_end"),
+    ("response", "speech_end", "tts_first_byte"),
+]
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+class Tracer:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.traces = collections.OrderedDict()     # key -> (events, info)
+        self.keys = itertools.count(1)
+        self.listening = None           # key of the utterance being heard
+        self.local = threading.local()
+        self.histograms = {}            # (metric, label) -> Histogram
+        self.counters = {}              # (metric, label) -> int
+        self.gauges = []                # (name, help, fn)
+        self.log = None
+        self.server = None
+
+    # HOT PATH
+
+    def begin(self):
+        """Speech onset: starts a new trace for the utterance being heard,
+        dropping the previous one if it never got as far as a command."""
+        now = time.monotonic()
+        with self.lock:
+            self.drop_unheard()
+            self.listening = next(self.keys)
+            self.traces[self.listening] = ({"onset": now}, {})
+
+            while len(self.traces) > MAX_OPEN_TRACES:
+                self.traces.popitem(last=False)
+
+    def bind(self, key):
+        """Makes key the trace of this thread's marks, e.g. for a handler
+        running the command of that utterance."""
+        self.local.key = key
+
+    def bound(self):
+        """Key bound to this thread, or None."""
+        return getattr(self.local, "key", None)
+
+    def mark(self, event, key=None, **info):
+        """Records the first occurrence of event in a trace."""
+        now = time.monotonic()
+        key = key or self.bound() or self.listening
+
+        with self.lock:
+            entry = self.traces.get(key)
+            if entry is None or event in entry[0]:
+                return
+
+            trace, trace_info = entry
+            trace[event] = now
+            trace_info.update(info)
+
+            # Complete once the handler is done and any speech it started
+            # has been played
+            if "handler_done" not in trace or \
+                    ("tts_request" in trace and "tts_end" not in trace):
+                return
+
+            del self.traces[key]
+            record = self.complete(trace, trace_info)
+
+        if self.log:
+            self.log.info(json.dumps(record, ensure_ascii=False))
+
+    def active(self, event, key=None):
+        """True if the trace still waits for event; lets callers on busy
+        paths skip building arguments for mark()."""
+        entry = self.traces.get(key or self.bound() or self.listening)
+        return entry is not None and event not in entry[0]
+
+    def end_utterance(self):
+        """Called when the VAD closes an utterance: a trace with no command
+        in it is not an interaction and is dropped."""
+        with self.lock:
+            self.drop_unheard()
+
+    def drop_unheard(self):
+        """Called with the lock held."""
+        entry = self.traces.get(self.listening)
+        if entry is not None and "asr_final" not in entry[0]:
+            del self.traces[self.listening]
+            self.count("veer_utterances_ignored_total")
+        self.listening = None
+
+    # AGGREGATION
+
+    def complete(self, trace, info):
+        """Called with the lock held. Returns the trace's log record."""
+        onset = trace["onset"]
+
+        for event, at in trace.items():
+            if event != "onset":
+                self.observe("veer_event_seconds", "event", event, at - onset)
+
+        stages = {}
+        for stage, start, end in STAGES:
+            if start in trace and end in trace and trace[end] >= trace[start]:
+                stages[stage] = trace[end] - trace[start]
+                self.observe("veer_stage_seconds", "stage", stage, stages[stage])
+
+        self.count("veer_utterances_total")
+        self.count("veer_intents_total", "intent", info.get("intent") or "none")
+
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "transcript": info.get("transcript"),
+            "intent": info.get("intent"),
+            "events_ms": {e: round((at - onset) * 1000, 1) for e, at in trace.items()},
+            "stages_ms": {s: round(v * 1000, 1) for s, v in stages.items()},
+        }
+
+    def observe(self, metric, label, value, seconds):
+        key = (metric, label, value)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds)
+
+    def count(self, metric, label=None, value=None):
+        key = (metric, label, value)
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def add_gauge(self, name, help_text, fn):
+        """fn() is read each time the metrics are served."""
+        self.gauges.append((name, help_text, fn))
+
+    # EXPORT
+
+    def open_log(self, path, max_bytes=1_000_000, backups=3):
+        """Structured log: one JSON line per completed utterance."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self.log = logging.getLogger("veer.trace")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.log.addHandler(handler)
+
+    def prometheus(self):
+        lines = []
+
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items(), key=lambda c: (c[0][0], str(c[0][2])))
+
+            seen = set()
+            for (metric, label, value), histogram in histograms:
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{value}"}} {histogram.total:.6f}')
+                lines.append(f'{metric}_count{{{label}="{value}"}} {histogram.count}')
+
+            for (metric, label, value), count in counters:
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                labels = f'{{{label}="{value}"}}' if label else ""
+                lines.append(f"{metric}{labels} {count}")
+
+        for name, help_text, fn in self.gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, path):
+        """Serves the metrics on a Unix socket from a background thread."""
+        tracer = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # HTTP clients send a request first; plain readers do not
+                self.request.settimeout(0.2)
+                try:
+                    request = self.request.recv(1024)
+                except socket.timeout:
+                    request = b""
+
+                body = tracer.prometheus().encode("utf-8")
+                if request.startswith(b"GET"):
+                    header = ("HTTP/1.0 200 OK\r\n"
+                              "Content-Type: text/plain; version=0.0.4\r\n"
+                              f"Content-Length: {len(body)}\r\n\r\n").encode("ascii")
+                    body = header + body
+                self.request.sendall(body)
+
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
@@ -0,0 +1,140 @@
+import collections
+import hashlib
+import mmap
+import os
+import threading
+
+# TTS PHRASE CACHE
+#
+# Phrases are kept on disk as raw 22050 Hz S16_LE mono PCM in <hash>.pcm,
+# where the hash covers the text and the voice model. Cached phrases are
+# memory-mapped and written straight to the audio sink.
+#
+# The cache never runs piper itself: the audio comes from the running piper,
+# captured by the caller while it speaks the phrase. Pinned phrases (fixed
+# confirmations) are captured once piper is up and never evicted. Other
+# phrases are captured the next time they are spoken once they have come up
+# a few times, and evicted least recently used first.
+
+SAMPLE_RATE = 22050
+
+class PhraseCache:
+
+    def __init__(self, cache_dir, model_path, max_dynamic=200, render_after=2,
+                 max_seen=2000):
+        self.cache_dir = cache_dir
+        self.model_path = model_path
+        self.max_dynamic = max_dynamic
+        self.render_after = render_after
+        self.max_seen = max_seen
+
+        self.lock = threading.Lock()
+        self.maps = {}                              # key -> open mmap
+        self.lru = collections.OrderedDict()        # unpinned keys, oldest first
+        self.pinned = set()
+        self.seen = collections.OrderedDict()       # key -> times spoken, oldest first
+
+        # Changing or re-downloading the voice invalidates every entry
+        stat = os.stat(model_path) if os.path.exists(model_path) else None
+        voice = f"{os.path.basename(model_path)}:{stat.st_size if stat else 0}:{stat.st_mtime if stat else 0}"
+        self.voice_id = hashlib.sha1(voice.encode("utf-8")).hexdigest()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        files = [f for f in os.listdir(cache_dir) if f.endswith(".pcm")]
+        files.sort(key=lambda f: os.path.getmtime(os.path.join(cache_dir, f)))
+        for f in files:
+            self.lru[f[:-4]] = True
+
+    def key(self, text):
+        data = f"{self.voice_id}\n{text.strip()}".encode("utf-8")
+        return hashlib.sha1(data).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".pcm")
+
+    # LOOKUP
+
+    def get(self, text):
+        """Memory-mapped PCM for text, or None if it is not rendered yet."""
+        key = self.key(text)
+
+        with self.lock:
+            if key not in self.lru and key not in self.pinned:
+                return None
+
+            if key in self.lru:
+                self.lru.move_to_end(key)
+
+            pcm = self.maps.get(key)
+            if pcm is None:
+                try:
+                    with open(self.path(key), "rb") as f:
+                        pcm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    self.lru.pop(key, None)
+                    return None
+                self.maps[key] = pcm
+
+        return pcm
+
+    def note_spoken(self, text):
+        """Counts a phrase about to go through piper. True if it should be
+        kept: the caller then hands piper's audio for it to store()."""
+        key = self.key(text)
+
+        with self.lock:
+            if key in self.pinned:
+                return not os.path.exists(self.path(key))
+
+            count = self.seen.pop(key, 0) + 1
+            self.seen[key] = count
+            while len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+
+            return count >= self.render_after and key not in self.lru
+
+    def pin(self, texts):
+        """Keeps these phrases cached for good. Returns the ones still to
+        be stored."""
+        missing = []
+
+        with self.lock:
+            for text in texts:
+                key = self.key(text)
+                self.pinned.add(key)
+                if self.lru.pop(key, None) is None:
+                    missing.append(text)
+
+        return missing
+
+    # STORING
+
+    def store(self, text, pcm):
+        """Keeps piper's audio for text."""
+        if not pcm:
+            return
+
+        key = self.key(text)
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(pcm)
+        os.replace(temp_path, self.path(key))
+
+        with self.lock:
+            self.seen.pop(key, None)
+            if key not in self.pinned:
+                self.lru[key] = True
+
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            while len(self.lru) > self.max_dynamic:
+                key, _ = self.lru.popitem(last=False)
+                # Not closed here: a speaker may still be writing it out
+                self.maps.pop(key, None)
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass